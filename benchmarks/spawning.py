@@ -0,0 +1,53 @@
+"""
+Measure how many test cases of a tiny executable are run per second with each
+way of starting the tested executables, refery's own overhead included.
+
+usage: python benchmarks/spawning.py [<tests> [<executable>]]
+"""
+
+import shutil
+import sys
+import time
+
+from refery.process import SPAWNERS
+from refery.supervisor import Supervisor
+from refery.test_suite import RunOptions, TestCase, Verbosity
+
+
+def measure(tests: int, executable: str, options: RunOptions, rounds: int = 5) -> float:
+    """
+    Run `tests` test cases of `executable` one after the other, in tests per
+    second. The best of `rounds` rounds is kept, as spawning processes is noisy.
+    """
+
+    best = 0.0
+    for _ in range(rounds):
+        start_time = time.perf_counter()
+        for test in range(tests // rounds):
+            case = TestCase(binary=executable, name=f"test {test}", stdout="", exit_code=0)
+            case.run(Verbosity.SILENT, options)
+        best = max(best, (tests // rounds) / (time.perf_counter() - start_time))
+    return best
+
+
+def main():
+    tests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    executable = sys.argv[2] if len(sys.argv) > 2 else shutil.which("true")
+    print(f"{tests} test cases of {executable}")
+
+    supervisor = Supervisor() if Supervisor.supported() else None
+    for name, spawn in SPAWNERS.items():
+        # Warm up, e.g. the page cache and the resolution of the executable
+        measure(100, executable, RunOptions(spawn=spawn), rounds=1)
+        alone = measure(tests, executable, RunOptions(spawn=spawn))
+        print(f"{name:>12}: {alone:.0f} tests/s", end="")
+        if supervisor is not None:
+            supervised = measure(tests, executable, RunOptions(spawn=spawn, supervisor=supervisor))
+            print(f", {supervised:.0f} tests/s with the supervisor", end="")
+        print()
+    if supervisor is not None:
+        supervisor.close()
+
+
+if __name__ == "__main__":
+    main()
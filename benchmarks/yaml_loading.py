@@ -0,0 +1,67 @@
+"""
+Measure the time spent parsing large generated test files, with the pure
+Python loader of PyYAML and with the libyaml one when it is available.
+
+usage: python benchmarks/yaml_loading.py [<tests> [<stdin bytes>]]
+"""
+
+import random
+import string
+import sys
+import time
+
+import yaml
+
+
+def generate(tests: int, stdin_size: int) -> str:
+    """Generate a test file with `tests` test cases with an inline stdin each."""
+
+    rng = random.Random(0)
+    alphabet = string.ascii_letters + string.digits + " "
+    testsuites = []
+    for suite in range(max(tests // 100, 1)):
+        testsuites.append({
+            "name": f"suite {suite}",
+            "tests": [
+                {
+                    "name": f"test {suite}.{test}",
+                    "args": ["--flag", str(test)],
+                    "stdin": "\n".join(
+                        "".join(rng.choices(alphabet, k=79))
+                        for _ in range(stdin_size // 80)
+                    ),
+                    "stdout": f"output {test}\n",
+                    "exit_code": 0,
+                }
+                for test in range(min(tests, 100))
+            ],
+        })
+    return yaml.dump({"default": {"binary": "/bin/cat"}, "testsuites": testsuites},
+                     Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper))
+
+
+def measure(document: str, loader: type) -> float:
+    start_time = time.perf_counter()
+    yaml.load(document, Loader=loader)
+    return time.perf_counter() - start_time
+
+
+def main():
+    tests = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    stdin_size = int(sys.argv[2]) if len(sys.argv) > 2 else 16 * 1024
+
+    document = generate(tests, stdin_size)
+    print(f"{tests} test cases, {len(document) / (1024 * 1024):.1f} MiB")
+
+    loaders = [yaml.SafeLoader]
+    if hasattr(yaml, "CSafeLoader"):
+        loaders.append(yaml.CSafeLoader)
+    else:
+        print("libyaml is not available, PyYAML was built without it")
+
+    for loader in loaders:
+        print(f"{loader.__name__:>12}: {measure(document, loader):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import asyncio
+import os
+import pathlib
+import signal
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Sequence, TypeVar, Union
+
+from refery.capture import (
+    CHUNK_SIZE,
+    DEFAULT_MEMORY_CAP,
+    CapturedStream,
+    IdleTimeoutExpired,
+    Input,
+    ProcessOutput,
+    Sink,
+    Stdin,
+)
+from refery.process import DEFAULT_GRACE_PERIOD, descendants, escaped, kill, signal_group
+from refery.scheduler import BaseScheduler
+
+T = TypeVar("T")
+
+
+class Process(asyncio.subprocess.Process):
+    """
+    A process started by `spawn`. Unlike the processes of
+    `asyncio.create_subprocess_exec`, it keeps its arguments, as
+    `subprocess.Popen` does, and can close its pipes.
+    """
+
+    def __init__(self, args: Sequence[Union[str, pathlib.Path]],
+                 transport: asyncio.SubprocessTransport,
+                 protocol: asyncio.subprocess.SubprocessStreamProtocol,
+                 loop: asyncio.AbstractEventLoop):
+        super().__init__(transport, protocol, loop)
+        self.args = args
+        self.transport = transport
+
+    def close(self):
+        """
+        Close the pipes of the process, which are otherwise only closed once
+        every process holding them exited.
+        """
+
+        self.transport.close()
+
+
+async def spawn(args: Sequence[Union[str, pathlib.Path]], **kwargs: Any) -> Process:
+    """
+    Same as `asyncio.create_subprocess_exec`, returning a `Process`.
+
+    :param args: The executable and its arguments.
+    :param kwargs: Same as `asyncio.create_subprocess_exec`, e.g. the standard
+                   input and outputs.
+    """
+
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.subprocess_exec(
+        lambda: asyncio.subprocess.SubprocessStreamProtocol(CHUNK_SIZE, loop),
+        *args,
+        **kwargs,
+    )
+    return Process(args, transport, protocol, loop)
+
+
+async def _chunks(stdin: Optional[Stdin]) -> AsyncIterator[memoryview]:
+    """The chunks of `stdin`, generated in another thread as it may block."""
+
+    if not isinstance(stdin, Input):
+        if stdin is not None:
+            yield memoryview(stdin)
+        return
+
+    chunks = stdin.chunks()
+    try:
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            yield memoryview(chunk)
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            await asyncio.to_thread(close)
+
+
+async def _feed(process: Process, stdin: Optional[Stdin]):
+    """Write `stdin` to the standard input of `process`, then close it."""
+
+    chunks = _chunks(stdin)
+    try:
+        async for chunk in chunks:
+            for start in range(0, len(chunk), CHUNK_SIZE):
+                process.stdin.write(chunk[start:start + CHUNK_SIZE])
+                await process.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # The process does not read its input anymore
+        pass
+    finally:
+        await chunks.aclose()
+        process.stdin.close()
+
+
+async def communicate(process: Process, stdin: Optional[Stdin] = None,
+                      timeout: Optional[float] = None,
+                      memory_cap: int = DEFAULT_MEMORY_CAP,
+                      stdout: Optional[Sink] = None, stderr: Optional[Sink] = None,
+                      stop: Optional[Callable[[], bool]] = None,
+                      idle_timeout: Optional[float] = None) -> ProcessOutput:
+    """
+    Same as `capture.communicate`, for a process started by `spawn` with pipes
+    for its standard input and outputs.
+
+    :raises subprocess.TimeoutExpired: If the process did not exit in time.
+    :raises IdleTimeoutExpired: If the process output nothing for too long.
+    """
+
+    stdout = CapturedStream(memory_cap) if stdout is None else stdout
+    stderr = CapturedStream(memory_cap) if stderr is None else stderr
+    stopped = False
+    loop = asyncio.get_running_loop()
+    last_output = loop.time()
+
+    async def read(pipe: asyncio.StreamReader) -> bytes:
+        if idle_timeout is None:
+            return await pipe.read(CHUNK_SIZE)
+        while True:
+            # Either output resets the idle timeout
+            left = last_output + idle_timeout - loop.time()
+            if left <= 0:
+                raise IdleTimeoutExpired(process.args, idle_timeout)
+            try:
+                return await asyncio.wait_for(pipe.read(CHUNK_SIZE), left)
+            except asyncio.TimeoutError:
+                continue
+
+    async def drain(pipe: asyncio.StreamReader, sink: Sink):
+        nonlocal stopped, last_output
+        while data := await read(pipe):
+            last_output = loop.time()
+            sink.write(data)
+            if stop is not None and not stopped and stop():
+                kill(process)
+                stopped = True
+
+    async def run() -> int:
+        await asyncio.gather(
+            _feed(process, stdin),
+            drain(process.stdout, stdout),
+            drain(process.stderr, stderr),
+        )
+        return await process.wait()
+
+    try:
+        exit_code = await asyncio.wait_for(run(), timeout)
+    except asyncio.TimeoutError:
+        raise subprocess.TimeoutExpired(process.args, timeout)
+    return ProcessOutput(stdout, stderr, exit_code, stopped)
+
+
+async def terminate(process: Process,
+                    grace_period: float = DEFAULT_GRACE_PERIOD) -> List[int]:
+    """Same as `process.terminate`, for a process started by `spawn`."""
+
+    tree = descendants(process.pid)
+    signal_group(process.pid, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), grace_period)
+    except asyncio.TimeoutError:
+        pass
+    # Children may have outlived their parent
+    signal_group(process.pid, signal.SIGKILL)
+    await process.wait()
+    # Descendants which left the group may still hold the pipes
+    process.close()
+    # The rest of the group is killed, if not dead yet
+    return escaped(tree, process.pid)
+
+
+class AsyncScheduler(BaseScheduler):
+    """
+    Same as `Scheduler`, but tasks are coroutines run on a single event loop,
+    in a thread of its own. At most `jobs` of them run at once, so that a
+    single thread can drive thousands of concurrent test cases.
+    """
+
+    def __init__(self, jobs: int = 1):
+        super().__init__(jobs)
+        self._futures: List[Future] = []
+
+        self._loop = asyncio.new_event_loop()
+        if sys.version_info < (3, 12) and hasattr(os, "pidfd_open"):
+            # Wait for the processes through the loop rather than in a thread
+            # each, as Python 3.12 does by itself
+            watcher = asyncio.PidfdChildWatcher()
+            watcher.attach_loop(self._loop)
+            asyncio.set_child_watcher(watcher)
+        self._slots = asyncio.Semaphore(jobs)
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="refery-event-loop", daemon=True
+        )
+        self._thread.start()
+
+    def __enter__(self) -> "AsyncScheduler":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def submit(self, fn: Callable[[], Awaitable[T]]) -> "Future[Optional[T]]":
+        """
+        Schedule a task.
+
+        :param fn: The task, returning a coroutine.
+        :return: A future holding the return value of the task, or `None` if
+                 the run was aborted before it started.
+        """
+
+        index = self._number()
+
+        async def task() -> Optional[T]:
+            async with self._slots:
+                if self.aborted(index):
+                    return None
+                with self._running(index):
+                    return await fn()
+
+        future = asyncio.run_coroutine_threadsafe(task(), self._loop)
+        self._futures.append(future)
+        return future
+
+    def shutdown(self):
+        """Drop the tasks that are not started, wait for the others and stop the loop."""
+
+        self._close()
+        for future in self._futures:
+            try:
+                future.result()
+            except BaseException:
+                pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
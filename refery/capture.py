@@ -0,0 +1,402 @@
+import hashlib
+import mmap
+import os
+import pathlib
+import selectors
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import IO, Callable, Dict, Iterator, Optional, Union
+
+from refery.process import kill
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_MEMORY_CAP = 16 * 1024 * 1024
+
+
+class IdleTimeoutExpired(subprocess.TimeoutExpired):
+    """Raised when a process output nothing for longer than its idle timeout."""
+
+    def __str__(self) -> str:
+        return f"Command '{self.cmd}' output nothing for {self.timeout} seconds"
+
+
+class Sink:
+    """Something data read from a process is written to."""
+
+    def write(self, data: bytes):
+        raise NotImplementedError()
+
+
+class Output:
+    """
+    Bytes produced by a process, which are not necessarily held in memory.
+    They are read by chunks so that huge outputs never have to fit in memory.
+    """
+
+    size: int = 0
+
+    def chunks(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Iterate over the content by chunks of at most `chunk_size` bytes."""
+
+        raise NotImplementedError()
+
+    def read(self) -> bytes:
+        """Read the whole content at once."""
+
+        return b"".join(self.chunks())
+
+    def view(self) -> memoryview:
+        """
+        View the whole content at once, without copying it when the output
+        allows it.
+        """
+
+        return memoryview(self.read())
+
+
+class BytesOutput(Output):
+    """An output held in memory."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.size = len(data)
+
+    def chunks(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        view = memoryview(self.data)
+        for offset in range(0, self.size, chunk_size):
+            yield bytes(view[offset:offset + chunk_size])
+
+    def read(self) -> bytes:
+        return self.data
+
+    def view(self) -> memoryview:
+        return memoryview(self.data)
+
+
+class CapturedStream(Output, Sink):
+    """
+    An output being captured: it is kept in memory up to `memory_cap` bytes and
+    spilled to a temporary file beyond. With a `memory_cap` of 0, it is written
+    to the temporary file right away.
+    It can be read concurrently by several threads once the capture is over.
+    """
+
+    def __init__(self, memory_cap: int = DEFAULT_MEMORY_CAP):
+        self.size = 0
+        if memory_cap > 0:
+            self._file = tempfile.SpooledTemporaryFile(max_size=memory_cap)
+        else:
+            # A spooled file never rolls over with a maximum size of 0
+            self._file = tempfile.TemporaryFile()
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes):
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(data)
+            self.size += len(data)
+
+    def chunks(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        offset = 0
+        while offset < self.size:
+            with self._lock:
+                self._file.seek(offset)
+                chunk = self._file.read(chunk_size)
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield chunk
+
+
+class FileOutput(Output):
+    """
+    An output stored in a file, read on demand.
+    The file is memory-mapped so that even huge files cost no heap memory:
+    chunks and views are slices of the mapping, which is unmapped once they
+    are all released.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.size = path.stat().st_size
+
+    def _open(self) -> IO[bytes]:
+        return open(self.path, "rb")
+
+    def _map(self) -> Optional[memoryview]:
+        """Map the file, or <code>None</code> if it cannot be mapped."""
+
+        if self.size == 0:
+            return memoryview(b"")
+        with self._open() as file:
+            try:
+                return memoryview(mmap.mmap(file.fileno(), self.size, access=mmap.ACCESS_READ))
+            except (OSError, ValueError):
+                # Not a regular file
+                return None
+
+    def chunks(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        view = self._map()
+        if view is None:
+            with self._open() as file:
+                file.seek(0)
+                yield from iter(lambda: file.read(chunk_size), b"")
+            return
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset:offset + chunk_size]
+
+    def view(self) -> memoryview:
+        view = self._map()
+        return super().view() if view is None else view
+
+
+class TemporaryFileOutput(FileOutput):
+    """
+    An output a process wrote straight to a temporary file, which is deleted
+    once the output is released.
+    """
+
+    def __init__(self, file: IO[bytes]):
+        self.file = file
+        self.path = pathlib.Path(f"/dev/fd/{file.fileno()}")
+        self.size = os.fstat(file.fileno()).st_size
+
+    def _open(self) -> IO[bytes]:
+        return open(os.dup(self.file.fileno()), "rb")
+
+
+def temporary_file(data: Optional[Union[bytes, memoryview]] = None) -> IO[bytes]:
+    """
+    Create an anonymous temporary file, in the directory given by TMPDIR.
+
+    :param data: What to write in the file, which is then rewound.
+    :return: The file.
+    """
+
+    file = tempfile.TemporaryFile()
+    if data is not None:
+        file.write(data)
+        file.seek(0)
+    return file
+
+
+class Input:
+    """
+    Data generated as it is written to the standard input of a process, so
+    that it never has to be held in memory, whatever its size.
+    """
+
+    def chunks(self) -> Iterator[bytes]:
+        """Generate the data from its beginning, by chunks."""
+
+        raise NotImplementedError()
+
+    def key(self) -> bytes:
+        """Identify the generated data without generating it."""
+
+        raise NotImplementedError()
+
+
+# What can be written to the standard input of a process
+Stdin = Union[bytes, memoryview, Input]
+
+
+def stdin_digest(stdin: Stdin) -> bytes:
+    """Hash a standard input, without generating it if it is an `Input`."""
+
+    if isinstance(stdin, Input):
+        return hashlib.sha256(b"generated:" + stdin.key()).digest()
+    digest = hashlib.sha256(b"data:")
+    digest.update(stdin)
+    return digest.digest()
+
+
+@dataclass
+class ProcessOutput:
+    """
+    What a process produced.
+
+    Arguments
+    ---------
+        stdout      Standard output of the process, or the sink it was written to
+        stderr      Standard error of the process, or the sink it was written to
+        exit_code   Exit code of the process
+        stopped     Indicates if the process was killed before it exited by itself
+    """
+
+    stdout: Union[Output, Sink]
+    stderr: Union[Output, Sink]
+    exit_code: int
+    stopped: bool = False
+
+
+class Capture:
+    """
+    Feed the standard input of a process and drain its standard output and
+    standard error at the same time, so that the process never blocks on a
+    full pipe.
+
+    The capture does not wait by itself: the pipes are registered in a
+    selector and `handle` is called whenever one of them is ready. This needs
+    selectors that can watch pipes, i.e. POSIX.
+
+    Outputs are written to `stdout` and `stderr` as they are read. Unless other
+    sinks are given, they are captured in `CapturedStream`s.
+    """
+
+    def __init__(self, process: subprocess.Popen, stdin: Optional[Stdin] = None,
+                 memory_cap: int = DEFAULT_MEMORY_CAP, stdout: Optional[Sink] = None,
+                 stderr: Optional[Sink] = None):
+        self.process = process
+        self.stdout = CapturedStream(memory_cap) if stdout is None else stdout
+        self.stderr = CapturedStream(memory_cap) if stderr is None else stderr
+        if isinstance(stdin, Input):
+            self._chunks = stdin.chunks()
+        else:
+            self._chunks = iter(() if stdin is None else (stdin,))
+        self._input = self._next_chunk()
+        self._sinks: Dict[IO, Sink] = {}
+        # When the process last output something, or started
+        self.last_output = time.monotonic()
+
+    def register(self, selector: selectors.BaseSelector):
+        """Register the pipes of the process in `selector`."""
+
+        if self.process.stdin is not None:
+            if self._input:
+                # Writes never block, so that more than PIPE_BUF bytes can be
+                # written at once
+                os.set_blocking(self.process.stdin.fileno(), False)
+                selector.register(self.process.stdin, selectors.EVENT_WRITE, self)
+            else:
+                self.process.stdin.close()
+        for pipe, sink in ((self.process.stdout, self.stdout),
+                           (self.process.stderr, self.stderr)):
+            if pipe is not None:
+                self._sinks[pipe] = sink
+                selector.register(pipe, selectors.EVENT_READ, self)
+
+    def unregister(self, selector: selectors.BaseSelector):
+        """Unregister the pipes of the process that are still open from `selector`."""
+
+        for pipe in (self.process.stdin, self.process.stdout, self.process.stderr):
+            if pipe is not None and not pipe.closed and pipe in selector.get_map():
+                selector.unregister(pipe)
+
+    @property
+    def closed(self) -> bool:
+        """Indicate if all the pipes of the process are closed, i.e. the capture is over."""
+
+        return all(pipe is None or pipe.closed
+                   for pipe in (self.process.stdin, self.process.stdout, self.process.stderr))
+
+    def handle(self, selector: selectors.BaseSelector, key: selectors.SelectorKey):
+        """Move data through the pipe of `key`, which is ready."""
+
+        if key.fileobj is self.process.stdin:
+            self._write(selector, key.fileobj)
+        else:
+            self._read(selector, key.fileobj)
+
+    def _next_chunk(self) -> memoryview:
+        """The next chunk of the input, only generated once there is room for it."""
+
+        for chunk in self._chunks:
+            if chunk:
+                return memoryview(chunk)
+        return memoryview(b"")
+
+    def _write(self, selector: selectors.BaseSelector, pipe: IO):
+        try:
+            written = os.write(pipe.fileno(), self._input[:CHUNK_SIZE])
+            self._input = self._input[written:] or self._next_chunk()
+        except BlockingIOError:
+            return
+        except BrokenPipeError:
+            # The process does not read its input anymore
+            self._input = memoryview(b"")
+        if not self._input:
+            self.close_input()
+            selector.unregister(pipe)
+            pipe.close()
+
+    def close_input(self):
+        """Stop generating the input."""
+
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+
+    def _read(self, selector: selectors.BaseSelector, pipe: IO):
+        data = os.read(pipe.fileno(), CHUNK_SIZE)
+        if data:
+            self.last_output = time.monotonic()
+            self._sinks[pipe].write(data)
+        else:
+            selector.unregister(pipe)
+            pipe.close()
+
+
+def communicate(process: subprocess.Popen, stdin: Optional[Stdin] = None,
+                timeout: Optional[float] = None, memory_cap: int = DEFAULT_MEMORY_CAP,
+                stdout: Optional[Sink] = None, stderr: Optional[Sink] = None,
+                stop: Optional[Callable[[], bool]] = None,
+                idle_timeout: Optional[float] = None) -> ProcessOutput:
+    """
+    Capture the outputs of a process until it exits.
+    Unlike `Popen.communicate`, outputs beyond `memory_cap` bytes are spilled
+    to disk instead of being held in memory.
+
+    :param process: The process, whose pipes are to be drained.
+    :param stdin: Data to write in the standard input of the process.
+    :param timeout: Timeout in seconds.
+    :param memory_cap: Number of bytes of each output kept in memory.
+    :param stdout: Where to write the standard output instead of capturing it.
+    :param stderr: Where to write the standard error instead of capturing it.
+    :param stop: Called whenever data was read. If it returns <code>True</code>,
+                 the process and its process group are killed.
+    :param idle_timeout: Time in seconds the process may go without outputting
+                         anything, as long as its outputs are open.
+    :return: The outputs of the process.
+    :raises subprocess.TimeoutExpired: If the process did not exit in time.
+    :raises IdleTimeoutExpired: If the process output nothing for too long.
+    """
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def remaining() -> Optional[float]:
+        if deadline is None:
+            return None
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise subprocess.TimeoutExpired(process.args, timeout)
+        return left
+
+    def remaining_or_idle() -> Optional[float]:
+        left = remaining()
+        if idle_timeout is None:
+            return left
+        idle_left = capture.last_output + idle_timeout - time.monotonic()
+        if idle_left <= 0:
+            raise IdleTimeoutExpired(process.args, idle_timeout)
+        return idle_left if left is None else min(left, idle_left)
+
+    capture = Capture(process, stdin, memory_cap, stdout, stderr)
+    stopped = False
+    with selectors.DefaultSelector() as selector:
+        capture.register(selector)
+        try:
+            while selector.get_map():
+                for key, _ in selector.select(remaining_or_idle()):
+                    key.data.handle(selector, key)
+                if stop is not None and not stopped and stop():
+                    kill(process)
+                    stopped = True
+        finally:
+            capture.close_input()
+
+    exit_code = process.wait(remaining())
+    return ProcessOutput(capture.stdout, capture.stderr, exit_code, stopped)
@@ -0,0 +1,247 @@
+import threading
+from typing import Callable, Dict, Iterator, Optional
+
+from colorama import Fore, Style
+
+from refery.capture import Output, Sink
+from refery.diff import DiffLimits
+from refery.prettify import decorate, pretty_diff
+
+WINDOW_SIZE = 4 * 1024
+
+
+def _common_prefix_length(a: memoryview, b: memoryview) -> int:
+    """Length of the common prefix of two buffers, found by bisection."""
+
+    # Memory views are compared item by item, bytes with memcmp
+    a, b = bytes(a), bytes(b)
+    if a == b:
+        return len(a)
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class Mismatch:
+    """
+    The failure of an assertion.
+    Explaining a failure may be costly, e.g. for large diffs, so it is only
+    rendered when a reporter asks for it, and at most once per format.
+    """
+
+    def __init__(self, name: str, explain: Callable[[bool], str]):
+        """
+        :param name: The name of the assertion.
+        :param explain: Render the reason for failure, colored or not.
+        """
+
+        self.name = name
+        self._explain = explain
+        self._explanations: Dict[bool, str] = {}
+        self._lock = threading.Lock()
+
+    def explain(self, colored: bool = True) -> str:
+        """Render the reason for failure."""
+
+        with self._lock:
+            if colored not in self._explanations:
+                self._explanations[colored] = self._explain(colored)
+            return self._explanations[colored]
+
+    def report(self, colored: bool = True) -> str:
+        """Render the report of the failure, as printed under a failed test case."""
+
+        name = decorate(self.name, Style.BRIGHT, Fore.BLUE) if colored else self.name
+        return f"Different {name}: \n{self.explain(colored)}\n\n"
+
+
+class OutputComparator(Sink):
+    """
+    Compare an output against an expected one while the output is being
+    written to it, chunk by chunk, so that the output never has to be held in
+    memory.
+    """
+
+    def __init__(self, expected: Output):
+        self.expected = expected
+
+    @property
+    def diverged(self) -> bool:
+        """Indicate if the output already cannot match the expected one."""
+
+        raise NotImplementedError()
+
+    def feed(self, output: Output) -> "OutputComparator":
+        """Write a whole output to the comparator."""
+
+        for chunk in output.chunks():
+            self.write(chunk)
+        return self
+
+    def result(self, name: str) -> Optional[Mismatch]:
+        """
+        Conclude the comparison once the whole output was written.
+
+        :param name: The name of the assertion.
+        :return: Returns the failure if the comparison fails, else <code>None</code>.
+        """
+
+        raise NotImplementedError()
+
+
+class StrictComparator(OutputComparator):
+    """
+    Check that an output is the same as the expected one, reading the expected
+    output in lockstep with the actual one.
+    The comparison stops at the first difference. Only `window` bytes before
+    and after it are kept to report a diff, rendered within `limits`.
+    """
+
+    def __init__(self, expected: Output, window: int = WINDOW_SIZE,
+                 limits: DiffLimits = DiffLimits()):
+        super().__init__(expected)
+        self.window = window
+        self.limits = limits
+
+        self._expected_chunks: Iterator[bytes] = expected.chunks()
+        self._pending = memoryview(b"")
+        # Matching bytes
+        self._offset = 0
+        self._context = bytearray()
+        # Bytes of the actual output after the first difference
+        self._diverged = False
+        self._actual_tail = bytearray()
+        self._truncated = False
+
+    @property
+    def diverged(self) -> bool:
+        return self._diverged
+
+    def _pull(self) -> memoryview:
+        return memoryview(next(self._expected_chunks, b""))
+
+    def _match(self, data: memoryview):
+        self._offset += len(data)
+        self._context += data[-self.window:]
+        del self._context[:-self.window]
+
+    def _count_lines(self, length: int) -> int:
+        """
+        Count the lines of the first `length` matching bytes, only needed to
+        report a difference.
+        """
+
+        lines, left = 0, length
+        for chunk in self.expected.chunks():
+            if left <= 0:
+                break
+            lines += bytes(chunk[:left]).count(b"\n")
+            left -= len(chunk)
+        return lines
+
+    def _diverge(self, data: memoryview):
+        self._diverged = True
+        self._keep_actual(data)
+
+    def _keep_actual(self, data: memoryview):
+        room = self.window - len(self._actual_tail)
+        if len(data) > room:
+            self._truncated = True
+        self._actual_tail += data[:max(room, 0)]
+
+    def write(self, data: bytes):
+        if self._diverged:
+            self._keep_actual(memoryview(data))
+            return
+
+        data = memoryview(data)
+        while data:
+            if not self._pending:
+                self._pending = self._pull()
+                if not self._pending:
+                    # The actual output is longer than the expected one
+                    self._diverge(data)
+                    return
+
+            length = min(len(data), len(self._pending))
+            common = _common_prefix_length(data[:length], self._pending[:length])
+            self._match(data[:common])
+            self._pending = self._pending[common:]
+            data = data[common:]
+            if common < length:
+                self._diverge(data)
+                return
+
+    def result(self, name: str) -> Optional[Mismatch]:
+        if not self._diverged:
+            if not self._pending:
+                self._pending = self._pull()
+            if not self._pending:
+                return None
+            # The actual output is shorter than the expected one
+            self._diverged = True
+
+        expected_tail = bytearray(self._pending)
+        while len(expected_tail) <= self.window:
+            chunk = self._pull()
+            if not chunk:
+                break
+            expected_tail += chunk
+        if len(expected_tail) > self.window:
+            self._truncated = True
+            del expected_tail[self.window:]
+
+        context = bytes(self._context)
+        partial = self._offset > len(context) or self._truncated
+        actual = context + self._actual_tail
+        expected = context + expected_tail
+        offset, window, limits = self._offset, self.window, self.limits
+        # Lines before the window, so that the diff shows the actual line numbers
+        lines = self._count_lines(offset - len(context)) if partial else 0
+        difference = lines + context.count(b"\n") + 1
+
+        def explain(colored: bool) -> str:
+            diff = pretty_diff(
+                actual.decode(errors="replace"),
+                expected.decode(errors="replace"),
+                limits,
+                colored,
+                first_line=lines + 1,
+            )
+            if not partial:
+                return diff
+            return (f"first difference at line {difference} "
+                    f"(byte {offset}), showing {window} bytes around it:\n"
+                    f"{diff}")
+
+        return Mismatch(name, explain)
+
+
+class ExistenceComparator(OutputComparator):
+    """
+    Check that an output is empty if and only if the expected one is.
+    """
+
+    def __init__(self, expected: Output):
+        super().__init__(expected)
+        self._empty = True
+
+    @property
+    def diverged(self) -> bool:
+        return self.expected.size == 0 and not self._empty
+
+    def write(self, data: bytes):
+        if data:
+            self._empty = False
+
+    def result(self, name: str) -> Optional[Mismatch]:
+        if self.expected.size == 0 and not self._empty:
+            return Mismatch(name, lambda _: "expected nothing, got something")
+        if self.expected.size != 0 and self._empty:
+            return Mismatch(name, lambda _: "expected something, got nothing")
+        return None
@@ -1,8 +1,12 @@
+import contextvars
 import sys
-from typing import IO
+import threading
+from typing import IO, Optional
 
 STDOUT = sys.stdout
 
+_install_lock = threading.Lock()
+
 
 class BufferedStream:
     def __init__(self, stream: IO):
@@ -26,9 +30,48 @@ class BufferedStream:
         return getattr(self.stream, attr)
 
 
+class ContextLocalStream:
+    """
+    Forward everything to the `BufferedStream` of the current context if it
+    has one, else to the wrapped stream.
+    Each thread and each asyncio task has its own context, which lets test
+    cases running in different threads or tasks buffer their output
+    independently.
+    """
+
+    def __init__(self, stream: IO):
+        self.stream = stream
+        self.local_buffer: contextvars.ContextVar[Optional[BufferedStream]] = \
+            contextvars.ContextVar('local_buffer', default=None)
+
+    @property
+    def current(self) -> IO:
+        buffer = self.local_buffer.get()
+        return self.stream if buffer is None else buffer
+
+    def write(self, data):
+        return self.current.write(data)
+
+    def writelines(self, datas):
+        return self.current.writelines(datas)
+
+    def read(self) -> str:
+        return self.current.read()
+
+    def flush(self):
+        return self.current.flush()
+
+    def __getattr__(self, attr):
+        return getattr(self.current, attr)
+
+
 def disable_stdout():
-    sys.stdout = BufferedStream(sys.stdout)
+    with _install_lock:
+        if not isinstance(sys.stdout, ContextLocalStream):
+            sys.stdout = ContextLocalStream(sys.stdout)
+    sys.stdout.local_buffer.set(BufferedStream(sys.stdout.stream))
 
 
 def enable_stdout():
-    sys.stdout = STDOUT
+    if isinstance(sys.stdout, ContextLocalStream):
+        sys.stdout.local_buffer.set(None)
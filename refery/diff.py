@@ -0,0 +1,204 @@
+import bisect
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+Opcode = Tuple[str, int, int, int, int]
+
+
+@dataclass
+class DiffLimits:
+    """
+    Limits on the rendering of a diff, beyond which only a summary is rendered.
+
+    Arguments
+    ---------
+        context     Number of unchanged lines shown around each change
+        max_hunks   Maximum number of hunks
+        max_bytes   Maximum size of the rendered diff, in bytes
+        max_cost    Maximum number of edits looked for in a region without any
+                    unique line, beyond which the region is replaced as a whole
+    """
+
+    context: int = 3
+    max_hunks: int = 50
+    max_bytes: int = 64 * 1024
+    max_cost: int = 1024
+
+
+def _myers(a: Sequence[str], b: Sequence[str], alo: int, ahi: int, blo: int,
+           bhi: int, max_cost: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Find the matching lines of a[alo:ahi] and b[blo:bhi] with Myers' algorithm.
+
+    :return: The matching (i, j) pairs, or <code>None</code> if the diff needs
+             more than `max_cost` edits.
+    """
+
+    n, m = ahi - alo, bhi - blo
+    max_d = min(n + m, max_cost)
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    trace = []
+    for d in range(max_d + 1):
+        trace.append(v[:])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x, y = x + 1, y + 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                break
+        else:
+            continue
+        break
+    else:
+        return None
+
+    matches = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[offset + prev_k]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x, y = x - 1, y - 1
+            matches.append((alo + x, blo + y))
+        x, y = prev_x, prev_y
+    return matches
+
+
+def _longest_increasing(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Longest subsequence of `pairs` whose second members increase."""
+
+    tails: List[int] = []
+    tail_indices: List[int] = []
+    previous: List[int] = []
+    for index, (_, j) in enumerate(pairs):
+        position = bisect.bisect_left(tails, j)
+        if position == len(tails):
+            tails.append(j)
+            tail_indices.append(index)
+        else:
+            tails[position] = j
+            tail_indices[position] = index
+        previous.append(tail_indices[position - 1] if position > 0 else -1)
+
+    result = []
+    index = tail_indices[-1] if tail_indices else -1
+    while index != -1:
+        result.append(pairs[index])
+        index = previous[index]
+    return result[::-1]
+
+
+def _matching_lines(a: Sequence[str], b: Sequence[str],
+                    max_cost: int) -> List[Tuple[int, int]]:
+    """
+    Find matching lines of `a` and `b` with the patience algorithm: lines that
+    are unique on both sides anchor the diff, and the regions between anchors
+    are diffed the same way. Regions without unique lines fall back to Myers'
+    algorithm.
+    """
+
+    matches = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo, blo = alo + 1, blo + 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi, bhi = ahi - 1, bhi - 1
+            matches.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+
+        a_counts = Counter(a[alo:ahi])
+        b_counts = Counter(b[blo:bhi])
+        b_unique = {b[j]: j for j in range(blo, bhi)
+                    if b_counts[b[j]] == 1 and a_counts[b[j]] == 1}
+        anchors = _longest_increasing(
+            [(i, b_unique[a[i]]) for i in range(alo, ahi) if a[i] in b_unique]
+        )
+        if not anchors:
+            matches += _myers(a, b, alo, ahi, blo, bhi, max_cost) or []
+            continue
+
+        matches += anchors
+        bounds = [(alo - 1, blo - 1), *anchors, (ahi, bhi)]
+        for (i1, j1), (i2, j2) in zip(bounds, bounds[1:]):
+            regions.append((i1 + 1, i2, j1 + 1, j2))
+
+    return sorted(matches)
+
+
+def diff(a: Sequence[str], b: Sequence[str], max_cost: int = DiffLimits.max_cost) -> List[Opcode]:
+    """
+    Compute the differences between two sequences of lines.
+    This runs in near linear time on usual inputs, at the cost of not always
+    finding the smallest diff.
+
+    :param a: The lines of the first sequence.
+    :param b: The lines of the second sequence.
+    :param max_cost: See `DiffLimits`.
+    :return: Opcodes in the format of `difflib.SequenceMatcher.get_opcodes`.
+    """
+
+    opcodes = []
+    i = j = 0
+    for mi, mj in [*_matching_lines(a, b, max_cost), (len(a), len(b))]:
+        if i < mi and j < mj:
+            opcodes.append(("replace", i, mi, j, mj))
+        elif i < mi:
+            opcodes.append(("delete", i, mi, j, mj))
+        elif j < mj:
+            opcodes.append(("insert", i, mi, j, mj))
+        if (mi, mj) == (len(a), len(b)):
+            break
+
+        last = opcodes[-1] if opcodes else None
+        if last is not None and last[0] == "equal" and last[2] == mi and last[4] == mj:
+            opcodes[-1] = ("equal", last[1], mi + 1, last[3], mj + 1)
+        else:
+            opcodes.append(("equal", mi, mi + 1, mj, mj + 1))
+        i, j = mi + 1, mj + 1
+
+    return opcodes
+
+
+def group(opcodes: List[Opcode], context: int = DiffLimits.context) -> Iterator[List[Opcode]]:
+    """
+    Group opcodes into hunks with `context` lines of context, like
+    `difflib.SequenceMatcher.get_grouped_opcodes`.
+    """
+
+    codes = list(opcodes)
+    if not codes:
+        return
+    tag, i1, i2, j1, j2 = codes[0]
+    if tag == "equal":
+        codes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    tag, i1, i2, j1, j2 = codes[-1]
+    if tag == "equal":
+        codes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+
+    hunk = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "equal" and i2 - i1 > 2 * context:
+            hunk.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            yield hunk
+            hunk = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        hunk.append((tag, i1, i2, j1, j2))
+    if hunk and not (len(hunk) == 1 and hunk[0][0] == "equal"):
+        yield hunk
@@ -0,0 +1,68 @@
+import os
+import pathlib
+import shlex
+from typing import Any, Dict, Iterator
+
+from refery.capture import FileOutput
+
+# The field of a test case each file provides, by extension
+EXTENSIONS = {
+    ".args": "args",
+    ".in": "stdin",
+    ".out": "stdout",
+    ".err": "stderr",
+    ".code": "exit_code",
+}
+
+
+class DiscoveryError(Exception):
+    """A test file that cannot be understood."""
+
+
+def _field(path: pathlib.Path, name: str) -> Any:
+    """
+    The value of the field `name` of a test case, given by the file `path`.
+    Inputs and outputs are not read here but when the test case runs.
+    """
+
+    if name == "args":
+        return shlex.split(path.read_text())
+    if name == "exit_code":
+        try:
+            return int(path.read_text())
+        except ValueError:
+            raise DiscoveryError(f"{path}: expected an exit code")
+    return FileOutput(path)
+
+
+def discover(directory: pathlib.Path, defaults: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Find the test cases of a directory.
+    A test case is made of the files sharing its name, each extension of
+    `EXTENSIONS` giving one of its fields: 'name.args' the arguments as they
+    would be written in a shell, 'name.in' the standard input, 'name.out' and
+    'name.err' the expected outputs, 'name.code' the expected exit code.
+    Each directory holding test cases is a test suite.
+
+    :param directory: The root of the test cases.
+    :param defaults: Values of the fields no file gives.
+    :return: The test suites, as in `Plan`, in alphabetical order.
+    :raises DiscoveryError: If a test file is invalid.
+    """
+
+    for root, directories, files in os.walk(directory):
+        directories.sort()
+        root = pathlib.Path(root)
+
+        tests: Dict[str, Dict[str, Any]] = {}
+        for file in sorted(files):
+            name, extension = os.path.splitext(file)
+            if extension not in EXTENSIONS:
+                continue
+            test = tests.setdefault(name, {**defaults, "name": name})
+            test[EXTENSIONS[extension]] = _field(root / file, EXTENSIONS[extension])
+
+        if tests:
+            relative = root.relative_to(directory)
+            name = directory.resolve().name if relative == pathlib.Path() else str(relative)
+            yield {"name": name, "tests": list(tests.values())}
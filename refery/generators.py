@@ -0,0 +1,126 @@
+import json
+import os
+import random
+import shlex
+import subprocess
+from typing import Any, Dict, Iterator, List, Union
+
+from refery.capture import CHUNK_SIZE, Input
+from refery.process import kill
+
+# Maps random bytes to printable characters, each of them standing for 4 byte
+# values so that they are equally likely
+_PRINTABLE = bytes(
+    b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"[i % 64]
+    for i in range(256)
+)
+
+
+class RepeatedInput(Input):
+    """A pattern repeated `times` times."""
+
+    def __init__(self, pattern: str, times: int):
+        self.pattern = pattern.encode()
+        self.times = times
+
+    def chunks(self) -> Iterator[bytes]:
+        if not self.pattern:
+            return
+        per_chunk = max(CHUNK_SIZE // len(self.pattern), 1)
+        chunk = self.pattern * per_chunk
+        full, rest = divmod(self.times, per_chunk)
+        for _ in range(full):
+            yield chunk
+        yield self.pattern * rest
+
+    def key(self) -> bytes:
+        return json.dumps(["repeat", self.pattern.decode(), self.times]).encode()
+
+
+class RandomLines(Input):
+    """
+    `count` lines of `length` random printable characters, always the same for
+    a given `seed`.
+    """
+
+    def __init__(self, count: int, length: int = 79, seed: int = 0):
+        self.count = count
+        self.length = length
+        self.seed = seed
+
+    def chunks(self) -> Iterator[bytes]:
+        rng = random.Random(self.seed)
+        per_chunk = max(CHUNK_SIZE // (self.length + 1), 1)
+        for first in range(0, self.count, per_chunk):
+            lines = min(per_chunk, self.count - first)
+            if not self.length:
+                yield b"\n" * lines
+                continue
+            data = rng.randbytes(lines * self.length).translate(_PRINTABLE)
+            yield b"".join(
+                data[i:i + self.length] + b"\n" for i in range(0, len(data), self.length)
+            )
+
+    def key(self) -> bytes:
+        return json.dumps(["random_lines", self.count, self.length, self.seed]).encode()
+
+
+class CommandInput(Input):
+    """
+    The standard output of a command, read as the tested binary consumes it.
+    The command must always output the same data, as it is run again for each
+    process it feeds, e.g. the ref and the tested binary.
+    """
+
+    def __init__(self, command: Union[str, List[str]]):
+        self.command = shlex.split(command) if isinstance(command, str) else command
+
+    def chunks(self) -> Iterator[bytes]:
+        process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            start_new_session=True,
+        )
+        try:
+            yield from iter(lambda: os.read(process.stdout.fileno(), CHUNK_SIZE), b"")
+            process.wait()
+        finally:
+            # The input is not needed anymore, e.g. the process it fed exited
+            if process.poll() is None:
+                kill(process)
+                process.wait()
+            process.stdout.close()
+
+    def key(self) -> bytes:
+        return json.dumps(["command", self.command]).encode()
+
+
+def from_spec(spec: Dict[str, Any]) -> Input:
+    """
+    Build a generated input from its description in a test file, one of:
+        - `{repeat: <pattern>, times: <N>}`
+        - `{random_lines: <N>, line_length: <N>, seed: <N>}`
+        - `{command: <command>}`
+
+    :param spec: The description of the input.
+    :return: The generated input.
+    :raises ValueError: If the description is invalid.
+    """
+
+    kinds = {"repeat", "random_lines", "command"} & spec.keys()
+    if len(kinds) != 1:
+        raise ValueError(
+            f"invalid stdin_generator {spec}: expected exactly one of "
+            "'repeat', 'random_lines' or 'command'"
+        )
+
+    if "repeat" in spec:
+        return RepeatedInput(str(spec["repeat"]), int(spec.get("times", 1)))
+    if "random_lines" in spec:
+        return RandomLines(
+            int(spec["random_lines"]),
+            int(spec.get("line_length", 79)),
+            int(spec.get("seed", 0)),
+        )
+    return CommandInput(spec["command"])
@@ -0,0 +1,70 @@
+from typing import IO, Any, Type, Union
+
+import yaml
+from yaml.composer import Composer
+
+try:
+    # Bindings to libyaml, an order of magnitude faster on large test files
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+def loader_name() -> str:
+    """The name of the loader used to parse test files."""
+
+    return SafeLoader.__name__
+
+
+def load(stream: Union[str, bytes, IO]) -> Any:
+    """
+    Parse a YAML document, like `yaml.safe_load` but with libyaml when
+    PyYAML was built with it.
+
+    :param stream: The document or a file holding it.
+    :return: The parsed document.
+    """
+
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def _describe(event_class: Type[yaml.Event]) -> str:
+    """Describe an event class, e.g. 'mapping start' for `MappingStartEvent`."""
+
+    name = event_class.__name__[:-len("Event")]
+    return "".join(f" {c.lower()}" if c.isupper() else c for c in name).strip()
+
+
+class StreamingLoader(SafeLoader, Composer):
+    """
+    A loader reading a document value by value, so that the beginning of a
+    large document can be used while the rest of it is still being parsed.
+
+    The structure of the document is walked through its events, and the
+    values found on the way are composed and constructed one at a time.
+    """
+
+    def __init__(self, stream: Union[str, bytes, IO]):
+        super().__init__(stream)
+        self.anchors = {}
+
+    def expect(self, event_class: Type[yaml.Event]) -> yaml.Event:
+        """
+        Consume the next event, which must be an `event_class`.
+
+        :raises yaml.MarkedYAMLError: If it is another event.
+        """
+
+        event = self.get_event()
+        if not isinstance(event, event_class):
+            raise yaml.MarkedYAMLError(
+                problem=f"expected {_describe(event_class)}, "
+                f"but found {_describe(type(event))}",
+                problem_mark=event.start_mark,
+            )
+        return event
+
+    def next_value(self) -> Any:
+        """Read the next value as a whole."""
+
+        return self.construct_document(self.compose_node(None, None))
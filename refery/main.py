@@ -1,20 +1,75 @@
+import queue
 import sys
+import threading
+from typing import Iterator, Union
 
 import junit_xml
 
-from refery.test_suite import get_testsuites
+from refery.aio import AsyncScheduler
+from refery.process import kill_running
+from refery.scheduler import Scheduler
+from refery.test_suite import TestFileError, TestSuite, get_testsuites
+
+
+def _schedule_all(testsuites: Iterator[TestSuite],
+                  scheduler: Union[Scheduler, AsyncScheduler], scheduled: queue.Queue):
+    """
+    Schedule the test suites as they are parsed and hand them over to the
+    reporter, along with the error that stopped the parsing if any.
+    """
+
+    try:
+        for testsuite in testsuites:
+            scheduled.put((testsuite, testsuite.schedule(scheduler)))
+    except BaseException as error:
+        scheduled.put(error)
+    else:
+        scheduled.put(None)
 
 
 def main() -> int:
-    testsuites, junit_file = get_testsuites()
+    testsuites, cmd_args, options = get_testsuites()
+
+    exit_code = 0
+    reported = []
+    error = None
+    engine = AsyncScheduler if cmd_args.engine == "asyncio" else Scheduler
+    with engine(cmd_args.jobs) as scheduler:
+        # Schedule everything first so that the workers never wait for a test
+        # suite to be reported before starting the next one, and so that the
+        # first test suites run while the rest of the test file is parsed
+        scheduled = queue.Queue()
+        threading.Thread(
+            target=_schedule_all,
+            args=(testsuites, scheduler, scheduled),
+            name="refery-parser",
+            daemon=True,
+        ).start()
+        try:
+            while (item := scheduled.get()) is not None:
+                if isinstance(item, TestFileError):
+                    error = item
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                testsuite, futures = item
+                reported.append(testsuite)
+                outcomes = (future.result() for future in futures)
+                exit_code |= testsuite.report(outcomes)
+        except KeyboardInterrupt:
+            # The tested executables run in sessions of their own, which the
+            # terminal does not interrupt
+            kill_running()
+            raise
+    options.close()
 
-    exit_code = 1
-    for testsuite in testsuites:
-        exit_code &= bool(testsuite.run())
+    if error is not None:
+        print(error, file=sys.stderr)
+        exit_code = 1
 
-    if junit_file is not None:
-        junit_testsuites = (t.junit_test_suite for t in testsuites)
-        with open(junit_file, "w") as file:
+    if cmd_args.junit_file is not None:
+        junit_testsuites = (t.junit_test_suite for t in reported)
+        with open(cmd_args.junit_file, "w") as file:
             file.write(junit_xml.to_xml_report_string(junit_testsuites))
 
     return exit_code
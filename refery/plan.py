@@ -0,0 +1,443 @@
+import glob
+import hashlib
+import multiprocessing
+import os
+import pathlib
+import pickle
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import IO, Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+import yaml
+
+import refery.loader as loader
+
+# Bumped whenever the layout of a plan changes, so that older plans are ignored
+PLAN_VERSION = 2
+
+# Included files larger than this are parsed in another process, smaller ones
+# are not worth the round trip
+PARALLEL_PARSE_SIZE = 1024 * 1024
+
+
+def default_directory() -> pathlib.Path:
+    """The directory of the plan cache when none is given, following XDG."""
+
+    cache_home = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(cache_home) / "refery" / "plans"
+
+
+def _digest(path: pathlib.Path) -> str:
+    """Hash the content of a file."""
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class Source:
+    """
+    A file a plan was compiled from.
+
+    Arguments
+    ---------
+        path        Absolute path to the file
+        digest      Hash of the content of the file
+        mtime_ns    Modification time of the file when it was hashed
+        size        Size of the file when it was hashed
+    """
+
+    path: pathlib.Path
+    digest: str
+    mtime_ns: int
+    size: int
+
+    def unchanged(self) -> bool:
+        """
+        Indicate if the content of the file is still the same.
+        The file is only hashed again if its modification time or its size
+        changed.
+        """
+
+        try:
+            stat = self.path.stat()
+            if (stat.st_mtime_ns, stat.st_size) == (self.mtime_ns, self.size):
+                return True
+            return _digest(self.path) == self.digest
+        except OSError:
+            return False
+
+
+@dataclass
+class Glob:
+    """
+    An include pattern of a plan, so that the plan is compiled again when the
+    pattern matches other files.
+
+    Arguments
+    ---------
+        pattern     Absolute include pattern
+        matches     The files it matched, in order
+    """
+
+    pattern: str
+    matches: List[pathlib.Path]
+
+    @classmethod
+    def of(cls, pattern: str) -> "Glob":
+        if not glob.has_magic(pattern):
+            # A plain path must exist, it is not just a pattern matching nothing
+            return cls(pattern, [pathlib.Path(pattern)])
+        return cls(pattern, sorted(pathlib.Path(p) for p in glob.glob(pattern, recursive=True)))
+
+    def unchanged(self) -> bool:
+        """Indicate if the pattern still matches the same files."""
+
+        return Glob.of(self.pattern).matches == self.matches
+
+
+@dataclass
+class Plan:
+    """
+    The test suites of a test file, expanded and ready to be instantiated.
+
+    Arguments
+    ---------
+        testsuites  The keyword arguments of each `TestSuite`, whose tests are
+                    the keyword arguments of each `TestCase`, defaults merged
+        sources     The files and the include patterns the plan was compiled from
+    """
+
+    testsuites: List[Dict[str, Any]]
+    sources: List[Union[Source, Glob]] = field(default_factory=lambda: [])
+
+
+class PlanCache:
+    """
+    Cache of the plans of test files, persisted on disk so that unchanged test
+    files are not parsed again by later runs.
+
+    There is one entry per test file, which is valid as long as the content
+    of the files the plan was compiled from is unchanged. Included files are
+    also cached on their own, so that only the ones that changed are parsed
+    again when a plan is stale.
+    """
+
+    def __init__(self, directory: pathlib.Path):
+        self.directory = directory
+
+    def _entry(self, path: pathlib.Path, included: bool = False) -> pathlib.Path:
+        key = hashlib.sha256(str(path.resolve()).encode()).hexdigest()
+        directory = self.directory / "files" if included else self.directory
+        return directory / f"{key}.v{PLAN_VERSION}.pickle"
+
+    @staticmethod
+    def _read(entry: pathlib.Path) -> Any:
+        try:
+            with open(entry, "rb") as file:
+                return pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+
+    @staticmethod
+    def _write(entry: pathlib.Path, value: Any):
+        """
+        Write an entry in a temporary file and move it in place so that
+        concurrent runs never see partial entries.
+        """
+
+        staging = entry.parent / f".tmp-{uuid.uuid4().hex}"
+        try:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            with open(staging, "wb") as file:
+                pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(staging, entry)
+        except OSError:
+            # The cache is an optimization, running without it is fine
+            staging.unlink(missing_ok=True)
+
+    def get(self, path: pathlib.Path) -> Optional[Plan]:
+        """
+        Look up the plan of a test file.
+
+        :param path: Path to the test file.
+        :return: The cached plan, or `None` if there is none or it is stale.
+        """
+
+        plan = self._read(self._entry(path))
+        if not isinstance(plan, Plan) or not all(s.unchanged() for s in plan.sources):
+            return None
+        return plan
+
+    def put(self, path: pathlib.Path, plan: Plan):
+        """
+        Store the plan of a test file.
+
+        :param path: Path to the test file.
+        :param plan: Its plan.
+        """
+
+        self._write(self._entry(path), plan)
+
+    def get_file(self, path: pathlib.Path) -> Optional[Tuple[Source, Any]]:
+        """
+        Look up the content of an included file.
+
+        :param path: Path to the included file.
+        :return: The file and its parsed content, or `None` if there is none
+                 or it is stale.
+        """
+
+        entry = self._read(self._entry(path, included=True))
+        if not isinstance(entry, tuple) or not entry[0].unchanged():
+            return None
+        return entry
+
+    def put_file(self, source: Source, content: Any):
+        """
+        Store the content of an included file.
+
+        :param source: The included file.
+        :param content: Its parsed content.
+        """
+
+        self._write(self._entry(source.path, included=True), (source, content))
+
+
+class _HashingReader:
+    """Hash a file while it is being read."""
+
+    def __init__(self, file: IO[bytes]):
+        self.file = file
+        self.name = file.name
+        self.digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        self.digest.update(data)
+        return data
+
+
+def _rename(mark: Optional[yaml.Mark], path: pathlib.Path) -> Optional[yaml.Mark]:
+    """The same position as `mark`, in the file at `path`."""
+
+    if mark is None:
+        return None
+    return yaml.Mark(str(path), mark.index, mark.line, mark.column, None, None)
+
+
+class _IncludeLoader:
+    """
+    Load included files in the background and in parallel, through the cache.
+    Large files are parsed in other processes, as parsing holds the GIL.
+    """
+
+    def __init__(self, cache: Optional[PlanCache] = None):
+        self.cache = cache
+        self._threads = ThreadPoolExecutor(thread_name_prefix="refery-include")
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "_IncludeLoader":
+        return self
+
+    def __exit__(self, *exc_info):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, path: pathlib.Path) -> "Future[Tuple[Source, Any]]":
+        """Start loading an included file."""
+
+        return self._threads.submit(self._load, path)
+
+    def _load(self, path: pathlib.Path) -> Tuple[Source, Any]:
+        cached = self.cache.get_file(path) if self.cache is not None else None
+        if cached is not None:
+            return cached
+
+        stat = path.stat()
+        data = path.read_bytes()
+        source = Source(path, hashlib.sha256(data).hexdigest(), stat.st_mtime_ns, stat.st_size)
+        try:
+            if len(data) < PARALLEL_PARSE_SIZE:
+                content = loader.load(data)
+            else:
+                content = self._process_pool().submit(loader.load, data).result()
+        except yaml.MarkedYAMLError as error:
+            # Parsed from bytes, the errors do not name the file otherwise
+            error.context_mark = _rename(error.context_mark, path)
+            error.problem_mark = _rename(error.problem_mark, path)
+            raise
+        if self.cache is not None:
+            self.cache.put_file(source, content)
+        return source, content
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._processes is None:
+                # Forking is unsafe once threads are running
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context(
+                    "forkserver" if "forkserver" in methods else "spawn"
+                )
+                self._processes = ProcessPoolExecutor(mp_context=context)
+            return self._processes
+
+
+def _expand(testsuite: Dict[str, Any], defaults: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge the defaults into the test cases of a test suite."""
+
+    tests = [{**defaults, **test} for test in testsuite["tests"]]
+    return {**testsuite, "tests": tests}
+
+
+def _start_includes(include: Union[None, str, List[str]], directory: pathlib.Path,
+                    plan: Plan, includes: _IncludeLoader,
+                    seen: Set[pathlib.Path]) -> List["Future[Tuple[Source, Any]]"]:
+    """
+    Start loading the files matching the `include` key of a test file, unless
+    they are already part of the plan.
+    Patterns are relative to the directory of the test file.
+    """
+
+    if include is None:
+        return []
+    if isinstance(include, str):
+        include = [include]
+
+    pending = []
+    for pattern in include:
+        matches = Glob.of(str(directory / pattern))
+        plan.sources.append(matches)
+        for match in matches.matches:
+            match = match.resolve()
+            if match not in seen:
+                seen.add(match)
+                pending.append(includes.submit(match))
+    return pending
+
+
+def _included(pending: List["Future[Tuple[Source, Any]]"], defaults: Dict[str, Any],
+              plan: Plan, includes: _IncludeLoader,
+              seen: Set[pathlib.Path]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the test suites of included files in order, the ones of the files
+    they include in turn coming right after theirs.
+    """
+
+    for future in pending:
+        source, content = future.result()
+        plan.sources.append(source)
+        if not isinstance(content, dict):
+            raise yaml.YAMLError(f"{source.path}: expected a mapping at the top level")
+
+        own_defaults = {**defaults, **(content.get("default") or {})}
+        nested = _start_includes(content.get("include"), source.path.parent,
+                                 plan, includes, seen)
+        for testsuite in content.get("testsuites") or []:
+            plan.testsuites.append(_expand(testsuite, own_defaults))
+            yield plan.testsuites[-1]
+        yield from _included(nested, own_defaults, plan, includes, seen)
+
+
+def compile_plan(path: pathlib.Path, plan: Plan,
+                 cache: Optional[PlanCache] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Parse a test file into `plan`, yielding its test suites as soon as they
+    are parsed so that they can run while the rest of the file is parsed.
+    Test suites can only be yielded once the defaults are known: they are held
+    back until the end of the file if `default` comes after `testsuites`.
+
+    The files matching the `include` key are loaded in parallel as soon as
+    the key is read. Their test suites come after the ones of the test file,
+    and their test cases inherit its defaults.
+
+    :param path: Path to the test file.
+    :param plan: The plan being compiled, filled as test suites are parsed.
+    :param cache: (optional) The plan cache, in which included files are cached.
+    :return: The test suites, with the defaults merged into their test cases.
+    :raises yaml.YAMLError: If the test file is not valid YAML.
+    """
+
+    path = path.resolve()
+    seen = {path}
+    stat = path.stat()
+    with open(path, "rb") as file, _IncludeLoader(cache) as includes:
+        reader = _HashingReader(file)
+        stream = loader.StreamingLoader(reader)
+        try:
+            stream.expect(yaml.StreamStartEvent)
+            stream.expect(yaml.DocumentStartEvent)
+            stream.expect(yaml.MappingStartEvent)
+
+            defaults: Optional[Dict[str, Any]] = None
+            pending = []
+            included = []
+            while not stream.check_event(yaml.MappingEndEvent):
+                key = stream.next_value()
+                if key == "default":
+                    defaults = stream.next_value() or {}
+                    for testsuite in pending:
+                        plan.testsuites.append(_expand(testsuite, defaults))
+                        yield plan.testsuites[-1]
+                    pending = []
+                elif key == "include":
+                    included += _start_includes(stream.next_value(), path.parent,
+                                                plan, includes, seen)
+                elif key == "testsuites":
+                    stream.expect(yaml.SequenceStartEvent)
+                    while not stream.check_event(yaml.SequenceEndEvent):
+                        testsuite = stream.next_value()
+                        if defaults is None:
+                            pending.append(testsuite)
+                            continue
+                        plan.testsuites.append(_expand(testsuite, defaults))
+                        yield plan.testsuites[-1]
+                    stream.get_event()
+                else:
+                    stream.next_value()
+            stream.get_event()
+            stream.expect(yaml.DocumentEndEvent)
+            stream.expect(yaml.StreamEndEvent)
+        finally:
+            stream.dispose()
+        plan.sources.append(Source(path, reader.digest.hexdigest(), stat.st_mtime_ns, stat.st_size))
+
+        defaults = defaults or {}
+        for testsuite in pending:
+            plan.testsuites.append(_expand(testsuite, defaults))
+            yield plan.testsuites[-1]
+        yield from _included(included, defaults, plan, includes, seen)
+
+
+def _compile_and_store(path: pathlib.Path,
+                       cache: Optional[PlanCache]) -> Iterator[Dict[str, Any]]:
+    plan = Plan([])
+    yield from compile_plan(path, plan, cache)
+    if cache is not None:
+        cache.put(path, plan)
+
+
+def load_plan(path: pathlib.Path,
+              cache: Optional[PlanCache] = None) -> Tuple[Iterator[Dict[str, Any]], bool]:
+    """
+    Get the test suites of a test file, from the cache if its plan is up to
+    date, else as the test file is parsed.
+
+    :param path: Path to the test file.
+    :param cache: (optional) The plan cache, in which the plan is stored once
+                  the test file is fully parsed.
+    :return: The test suites, as in `Plan`, and whether they came from the cache.
+             Parsing errors are raised while iterating over the test suites.
+    """
+
+    plan = cache.get(path) if cache is not None else None
+    if plan is not None:
+        return iter(plan.testsuites), True
+    return _compile_and_store(path, cache), False
@@ -1,9 +1,10 @@
 import re
-from difflib import unified_diff
-from typing import Optional, Callable, TypeVar, Type, Iterable, IO
+from typing import Optional, Iterable, IO, List
 
 from colorama.ansi import AnsiCodes, Fore, Style
 
+from refery.diff import DiffLimits, Opcode, diff, group
+
 _ANSI_decorations = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -/]*[@-~]')
 
 
@@ -31,57 +32,97 @@ def remove_decorations(input: str) -> str:
     return re.sub(_ANSI_decorations, '', input)
 
 
-def pretty_diff(actual: str, expected: str) -> str:
-    actual_lines = actual.replace('\n', '↵\n').splitlines()
-    expected_lines = expected.replace('\n', '↵\n').splitlines()
+def _format_range(start: int, stop: int) -> str:
+    """Format a range of lines the way unified diffs do."""
 
-    diff_lines = unified_diff(
-        expected_lines,
-        actual_lines,
-        fromfile='got',
-        tofile='expected',
-        lineterm='',
-    )
-    colored_lines = [
-        decorate(line, __get_diff_color(line)) for line in diff_lines
-    ]
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f'{beginning}'
+    if length == 0:
+        beginning -= 1
+    return f'{beginning},{length}'
 
-    return '\n'.join(colored_lines)
 
+def _no_decoration(input: str, *decorations: Optional[Iterable[AnsiCodes]]) -> str:
+    return input
 
-T = TypeVar('T')
 
+def _diff_summary(actual_lines: List[str], expected_lines: List[str],
+                  opcodes: List[Opcode], hunks: int, colored: bool,
+                  first_line: int = 1) -> str:
+    """Summarize a diff too large to be rendered."""
 
-def pretty_assert(name: str, actual: T, expected: T,
-                  compare: Callable[[T, T], Optional[str]],
-                  type: Type = str) -> bool:
-    """
-    Execute the `compare` function on `actual` and `expected`
-    and pretty-print a report.
+    paint = decorate if colored else _no_decoration
+    _, i1, _, j1, _ = next(op for op in opcodes if op[0] != 'equal')
+    removed = sum(i2 - i1 for tag, i1, i2, _, _ in opcodes if tag != 'equal')
+    added = sum(j2 - j1 for tag, _, _, j1, j2 in opcodes if tag != 'equal')
+
+    lines = [paint(f'first difference at line {i1 + first_line}:', Fore.BLUE)]
+    if i1 < len(actual_lines):
+        lines.append(paint(f'-{actual_lines[i1]}', Fore.RED))
+    if j1 < len(expected_lines):
+        lines.append(paint(f'+{expected_lines[j1]}', Fore.GREEN))
+    lines.append(f'{removed} lines removed and {added} lines added '
+                 f'in {hunks} hunks, diff too large to be shown')
+    return '\n'.join(lines)
 
 
-    :param name: The name of the assertion
+def pretty_diff(actual: str, expected: str, limits: DiffLimits = DiffLimits(),
+                colored: bool = True, first_line: int = 1) -> str:
+    """
+    Render a unified diff between what we got and what was expected.
+    If the diff exceeds `limits`, only its first difference is shown along
+    with the number of changed lines.
+
     :param actual: The actual value
     :param expected: The expected value
-    :param compare: The comparison function.
-                    Takes the actual value and the expected value as parameters
-    :param type: The type of the arguments - defaults to `str`
-    :return: The value of the compare function applied to actual and expected
+    :param limits: The limits of the rendered diff
+    :param colored: Indicates if the diff is decorated with colors
+    :param first_line: The number of the first line of both values, when they
+                       are windows of larger outputs - defaults to 1
+    :return: The rendered diff, empty if both values are the same
     """
 
-    msg = compare(actual, expected)
-    if msg is None:
-        return True
+    actual_lines = actual.replace('\n', '↵\n').splitlines()
+    expected_lines = expected.replace('\n', '↵\n').splitlines()
 
-    print(f'Different {decorate(name, Style.BRIGHT, Fore.BLUE)}: \n{msg}')
+    opcodes = diff(actual_lines, expected_lines, limits.max_cost)
+    hunks = list(group(opcodes, limits.context))
+    if not hunks:
+        return ''
+
+    diff_lines = ['--- got', '+++ expected']
+    size = 0
+    for hunk in hunks[:limits.max_hunks]:
+        _, i1, _, j1, _ = hunk[0]
+        _, _, i2, _, j2 = hunk[-1]
+        shift = first_line - 1
+        hunk_lines = [f'@@ -{_format_range(i1 + shift, i2 + shift)} '
+                      f'+{_format_range(j1 + shift, j2 + shift)} @@']
+        for tag, i1, i2, j1, j2 in hunk:
+            if tag == 'equal':
+                hunk_lines += (f' {line}' for line in actual_lines[i1:i2])
+                continue
+            hunk_lines += (f'-{line}' for line in actual_lines[i1:i2])
+            hunk_lines += (f'+{line}' for line in expected_lines[j1:j2])
+        diff_lines += hunk_lines
+        size += sum(len(line) + 1 for line in hunk_lines)
+        if size > limits.max_bytes:
+            break
+
+    if len(hunks) > limits.max_hunks or size > limits.max_bytes:
+        return _diff_summary(actual_lines, expected_lines, opcodes, len(hunks),
+                             colored, first_line)
+
+    if not colored:
+        return '\n'.join(diff_lines)
 
-    if type is str:
-        print()
-    else:
-        print(f'expected {decorate(expected, Fore.GREEN)}'
-              f', got {decorate(actual, Fore.RED)}')
+    colored_lines = [
+        decorate(line, __get_diff_color(line)) for line in diff_lines
+    ]
 
-    return False
+    return '\n'.join(colored_lines)
 
 
 __print = print
@@ -0,0 +1,344 @@
+import contextlib
+import functools
+import os
+import pathlib
+import signal
+import subprocess
+import threading
+import time
+from typing import IO, Callable, Dict, Iterator, List, Optional, Sequence, Set, Union
+
+# Time given to a process to exit after SIGTERM, before SIGKILL
+DEFAULT_GRACE_PERIOD = 2.0
+
+# Signals Python ignores, reset to their default in the processes it starts,
+# as `subprocess.Popen` does
+_RESTORED_SIGNALS = tuple(
+    getattr(signal, name) for name in ("SIGPIPE", "SIGXFZ", "SIGXFSZ") if hasattr(signal, name)
+)
+
+_executables: Set[pathlib.Path] = set()
+_executables_lock = threading.Lock()
+
+# Process groups of the tested binaries that are running, see `running`
+_running: Set[int] = set()
+_running_lock = threading.Lock()
+
+
+def kill(process: Union[subprocess.Popen, "SpawnedProcess"]):
+    """
+    Kill a process, along with its whole process group if it leads one.
+
+    :param process: The process to kill.
+    """
+
+    try:
+        if os.getpgid(process.pid) == process.pid:
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        # The process is already gone
+        pass
+
+
+def signal_group(pid: int, signum: int):
+    """
+    Send a signal to the process group led by `pid`, if it still exists.
+
+    :param pid: The process leading the group.
+    :param signum: The signal.
+    """
+
+    try:
+        os.killpg(pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+# Whether /proc lists the children of each thread, which saves a scan of
+# every process to find the descendants of one
+_PROC_CHILDREN = os.path.exists(f"/proc/self/task/{os.getpid()}/children")
+
+
+def _children(pid: int) -> List[int]:
+    """The children of a process, from /proc."""
+
+    children: List[int] = []
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        # Exited meanwhile
+        return children
+    for task in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{task}/children", "rb") as file:
+                children.extend(map(int, file.read().split()))
+        except OSError:
+            continue
+    return children
+
+
+def _parents() -> Dict[int, List[int]]:
+    """The children of every process, from a scan of /proc."""
+
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as file:
+                stat = file.read()
+        except OSError:
+            # Exited meanwhile
+            continue
+        # The name of the command, between parentheses, may contain spaces
+        parent = int(stat[stat.rindex(b")") + 2:].split()[1])
+        children.setdefault(parent, []).append(int(entry))
+    return children
+
+
+def descendants(pid: int) -> List[int]:
+    """
+    Find the descendants of a process, from /proc. Where there is no /proc,
+    none are found.
+
+    :param pid: The process.
+    :return: The process IDs of its descendants.
+    """
+
+    if _PROC_CHILDREN:
+        children = _children
+    else:
+        try:
+            children = _parents().get
+        except OSError:
+            return []
+
+    found = []
+    pending = [pid]
+    while pending:
+        for child in children(pending.pop()) or []:
+            found.append(child)
+            pending.append(child)
+    return found
+
+
+def escaped(pids: Sequence[int], group: int) -> List[int]:
+    """
+    Keep the processes that left a process group and are still running, i.e.
+    exist and are not zombies.
+
+    :param pids: The processes.
+    :param group: The ID of the process group.
+    """
+
+    running = []
+    for pid in pids:
+        try:
+            if os.getpgid(pid) == group:
+                continue
+            with open(f"/proc/{pid}/stat", "rb") as file:
+                stat = file.read()
+        except (ProcessLookupError, FileNotFoundError):
+            # Exited meanwhile
+            continue
+        except OSError:
+            # No /proc
+            running.append(pid)
+            continue
+        if stat[stat.rindex(b")") + 2:].split()[0] != b"Z":
+            running.append(pid)
+    return running
+
+
+def terminate(process: Union[subprocess.Popen, "SpawnedProcess"],
+              grace_period: float = DEFAULT_GRACE_PERIOD) -> List[int]:
+    """
+    Terminate a process leading its own process group, e.g. started in a new
+    session, along with the whole group: send it SIGTERM, give it
+    `grace_period` seconds to exit, then send SIGKILL to the group and reap
+    the process.
+
+    :param process: The process to terminate.
+    :param grace_period: Time given to the process to exit after SIGTERM.
+    :return: The descendants of the process which left its process group and
+             are still running.
+    """
+
+    tree = descendants(process.pid)
+    signal_group(process.pid, signal.SIGTERM)
+    try:
+        process.wait(grace_period)
+    except subprocess.TimeoutExpired:
+        pass
+    # Children may have outlived their parent
+    signal_group(process.pid, signal.SIGKILL)
+    process.wait()
+    # The rest of the group is killed, if not dead yet
+    return escaped(tree, process.pid)
+
+
+@contextlib.contextmanager
+def running(pid: int) -> Iterator[None]:
+    """
+    Keep track of a tested binary, given by its process ID, while it runs leading its own process
+    group, so that the group can be killed by `kill_running` if the run is
+    interrupted. Out of the session of refery, the group does not get the
+    signals of the terminal.
+    """
+
+    with _running_lock:
+        _running.add(pid)
+    try:
+        yield
+    finally:
+        with _running_lock:
+            _running.discard(pid)
+
+
+def kill_running():
+    """Kill the process groups of the tested binaries still running."""
+
+    with _running_lock:
+        groups = list(_running)
+    for pid in groups:
+        signal_group(pid, signal.SIGKILL)
+
+
+@functools.lru_cache(maxsize=None)
+def resolve(path: Union[str, pathlib.Path]) -> pathlib.Path:
+    """
+    Resolve the path of an executable, only once per run however many test
+    cases share it.
+    """
+
+    return pathlib.Path(path).resolve()
+
+
+def check_executable(path: pathlib.Path):
+    """
+    Check that an executable can be run, only once per run as long as it can.
+    Failures are not remembered, so that the setup of a test case can create
+    its executable.
+
+    :param path: The resolved path of the executable.
+    :raises FileNotFoundError: If there is no such file.
+    :raises PermissionError: If the file cannot be executed.
+    """
+
+    with _executables_lock:
+        if path in _executables:
+            return
+    if not path.is_file():
+        raise FileNotFoundError(f"No such file: {path}")
+    if not os.access(path, os.X_OK):
+        raise PermissionError(f"Not executable: {path}")
+    with _executables_lock:
+        _executables.add(path)
+
+
+def popen(args: List[Union[str, pathlib.Path]],
+          start_new_session: bool = False) -> subprocess.Popen:
+    """Start a process with pipes for its standard input and outputs."""
+
+    return subprocess.Popen(
+        args,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=start_new_session,
+    )
+
+
+class SpawnedProcess:
+    """
+    A process started with `os.posix_spawn`, with pipes for its standard input
+    and outputs. It provides the part of the interface of `subprocess.Popen`
+    that refery uses: the executable must be given by its resolved path, see
+    `resolve` and `check_executable`.
+    """
+
+    def __init__(self, args: Sequence[Union[str, pathlib.Path]],
+                 start_new_session: bool = False):
+        self.args = args
+        self.returncode: Optional[int] = None
+
+        # Pipes are not inheritable, only their ends duplicated on the
+        # standard streams of the child are
+        stdin_read, stdin_write = os.pipe()
+        stdout_read, stdout_write = os.pipe()
+        stderr_read, stderr_write = os.pipe()
+        child_ends = (stdin_read, stdout_write, stderr_write)
+        parent_ends = (stdin_write, stdout_read, stderr_read)
+        try:
+            self.pid = os.posix_spawn(
+                args[0],
+                list(args),
+                os.environ,
+                file_actions=[
+                    (os.POSIX_SPAWN_DUP2, fd, target) for target, fd in enumerate(child_ends)
+                ],
+                setsigdef=_RESTORED_SIGNALS,
+                # Only given when needed, as not every platform supports it
+                **({"setsid": True} if start_new_session else {}),
+            )
+        except BaseException:
+            for fd in parent_ends:
+                os.close(fd)
+            raise
+        finally:
+            for fd in child_ends:
+                os.close(fd)
+
+        self.stdin: IO[bytes] = open(stdin_write, "wb", buffering=0)
+        self.stdout: IO[bytes] = open(stdout_read, "rb", buffering=0)
+        self.stderr: IO[bytes] = open(stderr_read, "rb", buffering=0)
+
+    def poll(self) -> Optional[int]:
+        """Get the exit code of the process if it exited, else <code>None</code>."""
+
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid != 0:
+                self.returncode = os.waitstatus_to_exitcode(status)
+        return self.returncode
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        """
+        Wait for the process to exit.
+
+        :param timeout: Timeout in seconds.
+        :return: The exit code of the process, minus the signal that killed it if any.
+        :raises subprocess.TimeoutExpired: If the process did not exit in time.
+        """
+
+        if self.returncode is not None:
+            return self.returncode
+        if timeout is None:
+            _, status = os.waitpid(self.pid, 0)
+            self.returncode = os.waitstatus_to_exitcode(status)
+            return self.returncode
+
+        # Poll with an increasing delay, as `subprocess.Popen` does
+        deadline = time.monotonic() + timeout
+        delay = 0.0005
+        while self.poll() is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            delay = min(delay * 2, remaining, 0.05)
+            time.sleep(delay)
+        return self.returncode
+
+    def kill(self):
+        if self.returncode is None:
+            os.kill(self.pid, signal.SIGKILL)
+
+
+# How the tested binaries can be started, by name
+SPAWNERS: Dict[str, Callable[..., Union[subprocess.Popen, SpawnedProcess]]] = {
+    "popen": popen,
+}
+if hasattr(os, "posix_spawn"):
+    SPAWNERS["posix_spawn"] = SpawnedProcess
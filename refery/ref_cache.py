@@ -0,0 +1,169 @@
+import functools
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import threading
+import uuid
+from typing import List, Optional, Sequence, Set, Tuple
+
+from refery.capture import FileOutput, Output, ProcessOutput, Stdin, stdin_digest
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+
+def default_directory() -> pathlib.Path:
+    """The directory of the cache when none is given, following XDG."""
+
+    cache_home = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(cache_home) / "refery" / "refs"
+
+
+@functools.lru_cache(maxsize=None)
+def _file_digest(path: pathlib.Path, mtime_ns: int, size: int) -> str:
+    """
+    Hash the content of a file.
+    The modification time and the size are only part of the arguments so that
+    a file modified during the run is hashed again.
+    """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RefCache:
+    """
+    Content-addressed cache of the outputs of refs, persisted on disk.
+
+    Each entry is a directory named after its key, holding the standard output,
+    the standard error and the exit code of a ref. Entries are evicted in least
+    recently used order once the total size of the cache exceeds `max_size`
+    bytes, except the ones used by the current run, as outputs are read from
+    the entries on demand.
+    """
+
+    def __init__(self, directory: pathlib.Path, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+        self._in_use: Set[str] = set()
+
+    @staticmethod
+    def key(ref: pathlib.Path, args: Sequence[str], stdin: Optional[Stdin]) -> str:
+        """
+        Compute the key of a ref invocation.
+
+        :param ref: Path to the ref.
+        :param args: The arguments passed to the ref.
+        :param stdin: The standard input of the ref, if any.
+        :return: A key combining the content of the ref, its arguments and its
+                 standard input.
+        """
+
+        stat = ref.stat()
+        digest = hashlib.sha256()
+        digest.update(_file_digest(ref, stat.st_mtime_ns, stat.st_size).encode())
+        digest.update(json.dumps(list(map(str, args))).encode())
+        if stdin is None:
+            digest.update(b"\0")
+        else:
+            digest.update(b"\1")
+            digest.update(stdin_digest(stdin))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[ProcessOutput]:
+        """
+        Look up an entry and mark it as recently used.
+
+        :param key: The key of the entry.
+        :return: The cached output, or `None` if there is none.
+        """
+
+        entry = self.directory / key
+        with self._lock:
+            self._in_use.add(key)
+        try:
+            output = ProcessOutput(
+                stdout=FileOutput(entry / "stdout"),
+                stderr=FileOutput(entry / "stderr"),
+                exit_code=int((entry / "exit_code").read_text()),
+            )
+            os.utime(entry)
+        except (OSError, ValueError):
+            return None
+        return output
+
+    def put(self, key: str, output: ProcessOutput):
+        """
+        Store an entry, then evict the least recently used entries if the cache
+        is too large.
+        Entries are written in a temporary directory and moved in place so that
+        concurrent runs never see partial entries.
+
+        :param key: The key of the entry.
+        :param output: The output of the ref.
+        """
+
+        size = output.stdout.size + output.stderr.size
+        if size > self.max_size:
+            return
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        staging = self.directory / f".tmp-{uuid.uuid4().hex}"
+        staging.mkdir()
+        self._write(staging / "stdout", output.stdout)
+        self._write(staging / "stderr", output.stderr)
+        (staging / "exit_code").write_text(str(output.exit_code))
+        try:
+            os.rename(staging, self.directory / key)
+        except OSError:
+            # Another run stored the same entry in the meantime
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+
+        with self._lock:
+            self._in_use.add(key)
+            if self._size is None:
+                self._size = sum(size for _, _, size in self._entries())
+            else:
+                self._size += size
+            if self._size > self.max_size:
+                self._evict()
+
+    @staticmethod
+    def _write(path: pathlib.Path, output: Output):
+        with open(path, "wb") as file:
+            for chunk in output.chunks():
+                file.write(chunk)
+
+    def _entries(self) -> List[Tuple[float, pathlib.Path, int]]:
+        """List the entries of the cache as (last use, path, size) tuples."""
+
+        entries = []
+        for entry in self.directory.iterdir():
+            if entry.name.startswith("."):
+                continue
+            try:
+                size = sum(file.stat().st_size for file in entry.iterdir())
+                entries.append((entry.stat().st_mtime, entry, size))
+            except OSError:
+                continue
+        return entries
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits."""
+
+        entries = self._entries()
+        self._size = sum(size for _, _, size in entries)
+        for _, entry, size in sorted(entries):
+            if self._size <= self.max_size:
+                break
+            if entry.name in self._in_use:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            self._size -= size
@@ -0,0 +1,189 @@
+import itertools
+import pathlib
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Dict, Optional, Sequence, Tuple
+
+from refery.capture import (
+    DEFAULT_MEMORY_CAP,
+    FileOutput,
+    ProcessOutput,
+    Stdin,
+    communicate,
+    stdin_digest,
+)
+
+if TYPE_CHECKING:
+    from refery.ref_cache import RefCache
+
+
+def run_ref(ref: pathlib.Path, args: Sequence[str], stdin: Optional[Stdin],
+            memory_cap: int = DEFAULT_MEMORY_CAP) -> ProcessOutput:
+    """
+    Run a ref.
+
+    :param ref: Path to the ref.
+    :param args: The arguments passed to the ref.
+    :param stdin: The standard input of the ref, if any.
+    :param memory_cap: Number of bytes of each output kept in memory.
+    :return: The output of the ref.
+    """
+
+    process = subprocess.Popen(
+        [ref, *args],
+        stdin=subprocess.PIPE if stdin is not None else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    return communicate(process, stdin, memory_cap=memory_cap)
+
+
+class RefRunner:
+    """
+    Run the refs of a whole run, going through the cache when there is one.
+
+    When `concurrent` is set, test cases run their ref at the same time as the
+    tested executable instead of before it.
+
+    Each distinct invocation of a ref is only run once per run: requests for
+    an invocation that is already running wait for it instead. Once it is over,
+    its output is read from the cache, or, when it could not be cached, from a
+    copy kept in a temporary directory until the runner is closed. Outputs are
+    thus never held in memory beyond the test cases using them.
+    """
+
+    def __init__(self, cache: Optional["RefCache"] = None, concurrent: bool = False,
+                 memory_cap: int = DEFAULT_MEMORY_CAP):
+        self.cache = cache
+        self.concurrent = concurrent
+        self.memory_cap = memory_cap
+        self._lock = threading.Lock()
+        self._memo: Dict[Tuple, "Future[ProcessOutput]"] = {}
+        # Where the outputs that are not cached are kept, created on demand
+        self._directory: Optional[tempfile.TemporaryDirectory] = None
+        self._entries = itertools.count()
+
+    def close(self):
+        """Remove the outputs kept for the run, once every test case is over."""
+
+        with self._lock:
+            directory, self._directory = self._directory, None
+        if directory is not None:
+            directory.cleanup()
+
+    def submit(self, ref: pathlib.Path, args: Sequence[str],
+               stdin: Optional[Stdin]) -> "Future[ProcessOutput]":
+        """
+        Get the output of a ref, in the background if refs run concurrently,
+        else right away.
+
+        :param ref: Path to the ref.
+        :param args: The arguments passed to the ref.
+        :param stdin: The standard input of the ref, if any.
+        :return: A future holding the output of the ref.
+        """
+
+        future = Future()
+
+        def target():
+            try:
+                future.set_result(self.run(ref, args, stdin))
+            except BaseException as error:
+                future.set_exception(error)
+
+        if self.concurrent:
+            threading.Thread(target=target, daemon=True).start()
+        else:
+            target()
+        return future
+
+    def run(self, ref: pathlib.Path, args: Sequence[str],
+            stdin: Optional[Stdin]) -> ProcessOutput:
+        """
+        Get the output of a ref, running it only if it was neither run before
+        nor cached.
+
+        :param ref: Path to the ref.
+        :param args: The arguments passed to the ref.
+        :param stdin: The standard input of the ref, if any.
+        :return: The output of the ref.
+        """
+
+        key = (
+            str(ref),
+            tuple(args),
+            None if stdin is None else stdin_digest(stdin),
+        )
+        with self._lock:
+            future = self._memo.get(key)
+            owner = future is None
+            if owner:
+                future = self._memo[key] = Future()
+
+        if owner:
+            try:
+                output, cached = self._fetch(ref, args, stdin)
+                if not cached:
+                    output = self._keep(output)
+            except BaseException as error:
+                cached = True
+                future.set_exception(error)
+            else:
+                future.set_result(output)
+            if cached:
+                # Later requests get the output from the cache, and the waiters
+                # already hold the future
+                with self._lock:
+                    del self._memo[key]
+        return future.result()
+
+    def _fetch(self, ref: pathlib.Path, args: Sequence[str],
+               stdin: Optional[Stdin]) -> Tuple[ProcessOutput, bool]:
+        """
+        Get the output of a ref, running it only if it is not cached.
+
+        :param ref: Path to the ref.
+        :param args: The arguments passed to the ref.
+        :param stdin: The standard input of the ref, if any.
+        :return: The output of the ref, and whether it is read from the cache.
+        """
+
+        if self.cache is None:
+            return run_ref(ref, args, stdin, self.memory_cap), False
+
+        key = self.cache.key(ref, args, stdin)
+        output = self.cache.get(key)
+        if output is not None:
+            return output, True
+
+        output = run_ref(ref, args, stdin, self.memory_cap)
+        self.cache.put(key, output)
+        # Read from the entry, so that the captured output, its memory and its
+        # temporary file, are released right away
+        stored = self.cache.get(key)
+        # The entry is not stored when it is larger than the cache
+        return (output, False) if stored is None else (stored, True)
+
+    def _keep(self, output: ProcessOutput) -> ProcessOutput:
+        """
+        Copy the output of a ref that is not cached to the temporary directory
+        of the runner, so that it is read from there for the rest of the run
+        rather than held in memory.
+        """
+
+        with self._lock:
+            if self._directory is None:
+                self._directory = tempfile.TemporaryDirectory(prefix="refery-refs-")
+            entry = pathlib.Path(self._directory.name) / str(next(self._entries))
+        entry.mkdir()
+        for name in ("stdout", "stderr"):
+            with open(entry / name, "wb") as file:
+                for chunk in getattr(output, name).chunks():
+                    file.write(chunk)
+        return ProcessOutput(
+            stdout=FileOutput(entry / "stdout"),
+            stderr=FileOutput(entry / "stderr"),
+            exit_code=output.exit_code,
+        )
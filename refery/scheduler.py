@@ -0,0 +1,121 @@
+import contextlib
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class BaseScheduler:
+    """
+    What the schedulers share: tasks are numbered in submission order. When a
+    task aborts the run, the tasks submitted after it are not started anymore,
+    while the ones submitted before it still complete, as they would have in a
+    serial run.
+    """
+
+    def __init__(self, jobs: int = 1):
+        self.jobs = jobs
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._aborted_at: Optional[int] = None
+        self._closed = False
+        # Each thread, and each asyncio task, runs in a context of its own
+        self._index: contextvars.ContextVar[Optional[int]] = \
+            contextvars.ContextVar("index", default=None)
+
+    def _number(self) -> int:
+        """Number a task being submitted."""
+
+        with self._lock:
+            index = self._submitted
+            self._submitted += 1
+        return index
+
+    @contextlib.contextmanager
+    def _running(self, index: int) -> Iterator[None]:
+        """Make the task at `index` the current one, while it runs."""
+
+        token = self._index.set(index)
+        try:
+            yield
+        finally:
+            self._index.reset(token)
+
+    def _close(self):
+        """Prevent the tasks that are not started from starting."""
+
+        with self._lock:
+            self._closed = True
+
+    def aborted(self, index: int) -> bool:
+        """Indicate if the task submitted at `index` must not be started."""
+
+        with self._lock:
+            return self._closed or (self._aborted_at is not None and index > self._aborted_at)
+
+    @property
+    def current(self) -> Optional[int]:
+        """The index of the task running in the calling thread or task, if any."""
+
+        return self._index.get()
+
+    def abort(self, index: Optional[int] = None):
+        """
+        Abort the run: the tasks submitted after the task at `index` will not
+        be started.
+
+        :param index: The index of the aborting task - defaults to the task
+                      running in the calling thread or task.
+        """
+
+        index = self.current if index is None else index
+        if index is None:
+            raise RuntimeError("abort() must be called from a scheduled task")
+
+        with self._lock:
+            if self._aborted_at is None or index < self._aborted_at:
+                self._aborted_at = index
+
+
+class Scheduler(BaseScheduler):
+    """
+    Run tasks on a pool of workers shared by every test suite, so that the
+    number of tasks running at once is bounded for the whole run. See
+    `BaseScheduler` for aborting the run.
+    """
+
+    def __init__(self, jobs: int = 1):
+        super().__init__(jobs)
+        self._executor = ThreadPoolExecutor(max_workers=jobs)
+
+    def __enter__(self) -> "Scheduler":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def submit(self, fn: Callable[[], T]) -> "Future[Optional[T]]":
+        """
+        Schedule a task.
+
+        :param fn: The task.
+        :return: A future holding the return value of the task, or `None` if
+                 the run was aborted before it started.
+        """
+
+        index = self._number()
+
+        def task() -> Optional[T]:
+            if self.aborted(index):
+                return None
+            with self._running(index):
+                return fn()
+
+        return self._executor.submit(task)
+
+    def shutdown(self):
+        """Cancel the tasks that are not started and wait for the others."""
+
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,241 @@
+import heapq
+import itertools
+import os
+import selectors
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import refery.capture as capture
+from refery.capture import (
+    DEFAULT_MEMORY_CAP,
+    Capture,
+    IdleTimeoutExpired,
+    Input,
+    ProcessOutput,
+    Sink,
+    Stdin,
+)
+from refery.process import kill
+
+
+class _Supervised:
+    """A process the supervisor drives, along with its capture."""
+
+    def __init__(self, process: subprocess.Popen, capture: Capture, timeout: Optional[float],
+                 stop: Optional[Callable[[], bool]], idle_timeout: Optional[float]):
+        self.process = process
+        self.capture = capture
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.stop = stop
+        self.stopped = False
+        self.pidfd: Optional[int] = None
+        self.exit_code: Optional[int] = None
+        self.future: "Future[ProcessOutput]" = Future()
+
+
+class Supervisor:
+    """
+    Drive every running process from a single thread: their pipes and their
+    pidfds, which become readable once they exit, are all registered in one
+    selector, and their timeouts are kept in a heap. Idle timeouts are only
+    checked, and pushed back, when they are due. Noticing that a process
+    exited or timed out then costs the same whatever the number of processes
+    running at once, without a thread or a polling loop per process.
+
+    Requires pidfds, i.e. Linux, see `supported`.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._pending: List[_Supervised] = []
+        # Deadlines, with whether they are idle timeouts
+        self._timers: List[Tuple[float, int, _Supervised, bool]] = []
+        self._sequence = itertools.count()
+        self._supervised: Dict[Capture, _Supervised] = {}
+
+        # Written to wake the thread up when a process is submitted
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ)
+
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="refery-supervisor", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def supported() -> bool:
+        """Indicate if the platform provides pidfds."""
+
+        return hasattr(os, "pidfd_open")
+
+    def communicate(self, process: subprocess.Popen, stdin: Optional[Stdin] = None,
+                    timeout: Optional[float] = None, memory_cap: int = DEFAULT_MEMORY_CAP,
+                    stdout: Optional[Sink] = None, stderr: Optional[Sink] = None,
+                    stop: Optional[Callable[[], bool]] = None,
+                    idle_timeout: Optional[float] = None) -> ProcessOutput:
+        """
+        Same as `capture.communicate`, but the process is driven by the
+        supervisor while the calling thread waits.
+        """
+
+        if isinstance(stdin, Input):
+            # Generating the input may block, e.g. on the pipe of a command,
+            # which would hold up every other process
+            return capture.communicate(
+                process, stdin, timeout, memory_cap, stdout, stderr, stop, idle_timeout
+            )
+
+        supervised = _Supervised(
+            process, Capture(process, stdin, memory_cap, stdout, stderr), timeout, stop,
+            idle_timeout,
+        )
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("the supervisor is closed")
+            self._pending.append(supervised)
+        self._wake_up()
+        return supervised.future.result()
+
+    def close(self):
+        """Stop the supervisor thread, once the processes it drives are over."""
+
+        with self._lock:
+            self._closed = True
+        self._wake_up()
+        self._thread.join()
+        self._selector.close()
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
+
+    def _wake_up(self):
+        try:
+            os.write(self._wakeup_write, b"\0")
+        except BlockingIOError:
+            # The thread is already bound to wake up
+            pass
+
+    def _run(self):
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                if self._closed and not pending and not self._supervised:
+                    return
+            for supervised in pending:
+                self._start(supervised)
+
+            for key, _ in self._selector.select(self._next_timeout()):
+                if key.fileobj == self._wakeup_read:
+                    while True:
+                        try:
+                            if not os.read(self._wakeup_read, 4096):
+                                break
+                        except BlockingIOError:
+                            break
+                elif isinstance(key.data, Capture):
+                    supervised = self._supervised.get(key.data)
+                    if supervised is not None:
+                        self._handle(supervised, key)
+                else:
+                    self._reap(key.data)
+            self._expire()
+
+    def _start(self, supervised: _Supervised):
+        try:
+            # Nothing but the supervisor reaps the process, so it still exists
+            supervised.pidfd = os.pidfd_open(supervised.process.pid)
+        except OSError as error:
+            supervised.future.set_exception(error)
+            return
+
+        self._supervised[supervised.capture] = supervised
+        supervised.capture.register(self._selector)
+        self._selector.register(supervised.pidfd, selectors.EVENT_READ, supervised)
+        if supervised.timeout is not None:
+            self._arm(time.monotonic() + supervised.timeout, supervised)
+        if supervised.idle_timeout is not None:
+            self._arm(supervised.capture.last_output + supervised.idle_timeout, supervised, idle=True)
+
+    def _arm(self, deadline: float, supervised: _Supervised, idle: bool = False):
+        heapq.heappush(self._timers, (deadline, next(self._sequence), supervised, idle))
+
+    def _next_timeout(self) -> Optional[float]:
+        """Time until the next deadline, if any."""
+
+        while self._timers and self._timers[0][2].future.done():
+            # Over before its deadline
+            heapq.heappop(self._timers)
+        if not self._timers:
+            return None
+        return max(self._timers[0][0] - time.monotonic(), 0)
+
+    def _handle(self, supervised: _Supervised, key: selectors.SelectorKey):
+        try:
+            supervised.capture.handle(self._selector, key)
+            if supervised.stop is not None and not supervised.stopped and supervised.stop():
+                kill(supervised.process)
+                supervised.stopped = True
+        except BaseException as error:
+            self._finish(supervised, error=error)
+            return
+        self._conclude(supervised)
+
+    def _reap(self, supervised: _Supervised):
+        """Get the exit code of a process whose pidfd is readable, i.e. which exited."""
+
+        if supervised.pidfd is None:
+            # Timed out while the event was pending
+            return
+        self._selector.unregister(supervised.pidfd)
+        os.close(supervised.pidfd)
+        supervised.pidfd = None
+        supervised.exit_code = supervised.process.wait()
+        self._conclude(supervised)
+
+    def _conclude(self, supervised: _Supervised):
+        """Finish the supervision of a process once it exited and its pipes are closed."""
+
+        if supervised.capture.closed and supervised.exit_code is not None:
+            self._finish(supervised)
+
+    def _expire(self):
+        """Give up on the processes whose deadline passed."""
+
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, supervised, idle = heapq.heappop(self._timers)
+            if supervised.future.done():
+                continue
+            if not idle:
+                error = subprocess.TimeoutExpired(supervised.process.args, supervised.timeout)
+                self._finish(supervised, error=error)
+            elif not supervised.capture.closed:
+                # Pushed back as long as the process keeps outputting
+                deadline = supervised.capture.last_output + supervised.idle_timeout
+                if deadline > now:
+                    self._arm(deadline, supervised, idle=True)
+                else:
+                    error = IdleTimeoutExpired(supervised.process.args, supervised.idle_timeout)
+                    self._finish(supervised, error=error)
+
+    def _finish(self, supervised: _Supervised, error: Optional[BaseException] = None):
+        capture = supervised.capture
+        capture.close_input()
+        capture.unregister(self._selector)
+        if supervised.pidfd is not None:
+            self._selector.unregister(supervised.pidfd)
+            os.close(supervised.pidfd)
+            supervised.pidfd = None
+        del self._supervised[capture]
+
+        if error is not None:
+            supervised.future.set_exception(error)
+        else:
+            supervised.future.set_result(ProcessOutput(
+                capture.stdout, capture.stderr, supervised.exit_code, supervised.stopped
+            ))
@@ -1,27 +1,85 @@
 import argparse
+import asyncio
+import contextlib
 import enum
+import functools
+import os
 import pathlib
 import subprocess
 import sys
 import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import List, Optional
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 import junit_xml as jxml
 import yaml
 from colorama import Fore, Style
 
+import refery.aio as aio
 import refery.custom_io as io
+import refery.generators as generators
+import refery.loader as loader
+from refery.discovery import DiscoveryError, discover
+from refery.plan import PlanCache, load_plan
+from refery.plan import default_directory as plan_directory
+from refery.ref_cache import DEFAULT_MAX_SIZE, RefCache, default_directory
+from refery.capture import (
+    DEFAULT_MEMORY_CAP,
+    BytesOutput,
+    CapturedStream,
+    FileOutput,
+    IdleTimeoutExpired,
+    Input,
+    Output,
+    ProcessOutput,
+    Stdin,
+    TemporaryFileOutput,
+    communicate,
+    temporary_file,
+)
+from refery.compare import (
+    ExistenceComparator,
+    Mismatch,
+    OutputComparator,
+    StrictComparator,
+)
+from refery.diff import DiffLimits
+from refery.reference import RefRunner
+from refery.process import (
+    DEFAULT_GRACE_PERIOD,
+    SPAWNERS,
+    check_executable,
+    popen,
+    resolve,
+    running,
+    terminate,
+)
+from refery.scheduler import Scheduler
+from refery.supervisor import Supervisor
 from refery.prettify import (
     print,
     decorate,
-    pretty_assert,
-    pretty_diff,
     remove_decorations,
 )
 
 
+T = TypeVar("T")
+
+
 class OutputMode(Enum):
     """
     The way the output is tested
@@ -36,25 +94,42 @@ class OutputMode(Enum):
     STRICT = ("strict",)
     EXISTS = ("exists",)
 
-    def compare_outputs(self, expected: str, actual: str) -> Optional[str]:
+    def comparator(self, expected: Output,
+                   diff_limits: DiffLimits = DiffLimits()) -> OutputComparator:
         """
-        Compare strings according to the output mode.
+        Create a comparator checking an output according to the output mode.
 
         :param expected: The expected output.
-        :param actual: The actual output.
-        :return: Returns string containing the reason for failure if the comparison fails, else <code>None</code>.
+        :param diff_limits: The limits of the diffs reporting failures.
+        :return: A comparator to write the actual output to.
         """
 
         if self.value[0] == "exists":
-            return (
-                "expected nothing, got something"
-                if expected == "" and actual != ""
-                else "expected something, got nothing"
-                if expected != "" and actual == ""
-                else None
-            )
+            return ExistenceComparator(expected)
+
+        return StrictComparator(expected, limits=diff_limits)
 
-        return None if expected == actual else pretty_diff(actual, expected)
+
+class IOMode(enum.Enum):
+    """
+    How the tested binary is given its standard input and outputs.
+    - PIPE streams them through pipes, compared while the binary runs.
+    - FILE gives the binary files instead: the standard input is passed as a
+      file, and the outputs are redirected to temporary files that are
+      compared through a memory mapping once it exits. Large payloads are then
+      never copied through Python. Generated inputs, `stop_on_mismatch` and
+      `idle_timeout` need pipes, so they are always run in PIPE mode.
+    """
+
+    PIPE = "pipe"
+    FILE = "file"
+
+
+class TestFileError(Exception):
+    """
+    A test file that cannot be read, raised while its test suites are
+    generated, once the ones before the error were.
+    """
 
 
 class TestResult(enum.Enum):
@@ -84,6 +159,51 @@ class Verbosity(enum.Enum):
     NORMAL = "normal"
 
 
+def _completed(value: T) -> "Future[T]":
+    """A future that is already done."""
+
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+@dataclass
+class RunOptions:
+    """
+    Options shared by all the test cases of a run.
+
+    Arguments
+    ---------
+        refs            The runner of the refs - defaults to a runner without cache
+        memory_cap      Number of bytes of each output kept in memory, beyond which it is spilled to disk
+        diff_limits     The limits of the diffs reporting failures
+        comparisons     (optional) Pool running the assertions, away from the workers running the test cases
+        supervisor      (optional) Supervisor driving the tested binaries, instead of the workers waiting for them
+        spawn           Starts the tested binaries with pipes, see `process.SPAWNERS` - defaults to `subprocess.Popen`
+        grace_period    Time given to a timed out binary to exit after SIGTERM, before its process group is killed
+    """
+
+    refs: RefRunner = field(default_factory=RefRunner)
+    memory_cap: int = DEFAULT_MEMORY_CAP
+    diff_limits: DiffLimits = field(default_factory=DiffLimits)
+    comparisons: Optional[Executor] = None
+    supervisor: Optional[Supervisor] = None
+    spawn: Callable[..., Any] = popen
+    grace_period: float = DEFAULT_GRACE_PERIOD
+
+    def close(self):
+        """
+        Stop the comparison pool and the supervisor, and remove the outputs
+        kept by the runner of the refs, once every test case is over.
+        """
+
+        self.refs.close()
+        if self.comparisons is not None:
+            self.comparisons.shutdown()
+        if self.supervisor is not None:
+            self.supervisor.close()
+
+
 @dataclass
 class TestCase:
     """
@@ -91,18 +211,25 @@ class TestCase:
 
     Arguments
     ---------
-        binary          Path to the tested binary
-        name            The name of the test case
-        args            (optional) The arguments passed to the executable
-        ref             (optional) Path to a binary with the expected outputs
-        stdin           (optional) String to pass in the standard input
-        stdout          (optional) Expected standard output
-        stderr          (optional) Expected standard error
-        exit_code       (optional) Expected exit code
-        stdout_mode     See `OutputMode` - defaults to STRICT
-        stderr_mode     See `OutputMode` - defaults STRICT
-        skipped         (optional) Indicates if the test is ignored
-        timeout         (optional) Timeout in seconds
+        binary              Path to the tested binary
+        name                The name of the test case
+        args                (optional) The arguments passed to the executable
+        ref                 (optional) Path to a binary with the expected outputs
+        stdin               (optional) String to pass in the standard input, or an `Output` to read it from
+        stdout              (optional) Expected standard output, as a string or an `Output`
+        stderr              (optional) Expected standard error, as a string or an `Output`
+        stdin_file          (optional) Path to a file to pass in the standard input, instead of `stdin`
+        stdout_file         (optional) Path to a file holding the expected standard output, instead of `stdout`
+        stderr_file         (optional) Path to a file holding the expected standard error, instead of `stderr`
+        stdin_generator     (optional) Description of a standard input generated as it is written, instead of `stdin`, see `generators.from_spec`
+        exit_code           (optional) Expected exit code
+        stdout_mode         See `OutputMode` - defaults to STRICT
+        stderr_mode         See `OutputMode` - defaults STRICT
+        skipped             (optional) Indicates if the test is ignored
+        timeout             (optional) Timeout in seconds
+        idle_timeout        (optional) Time in seconds the binary may go without outputting anything before it is killed
+        stop_on_mismatch    (optional) Indicates if the binary is killed as soon as an output cannot match anymore
+        io_mode             See `IOMode` - defaults to PIPE
     """
 
     binary: pathlib.Path
@@ -111,48 +238,147 @@ class TestCase:
     args: List[str] = field(default_factory=lambda: [])
     ref: str = None
 
-    stdin: Optional[str] = None
-    stdout: Optional[str] = None
-    stderr: Optional[str] = None
+    stdin: Optional[Union[str, Output, Input]] = None
+    stdout: Optional[Union[str, Output]] = None
+    stderr: Optional[Union[str, Output]] = None
     exit_code: Optional[int] = None
 
+    stdin_file: Optional[str] = None
+    stdout_file: Optional[str] = None
+    stderr_file: Optional[str] = None
+    stdin_generator: Optional[Dict[str, Any]] = None
+
     stdout_mode: OutputMode = OutputMode.STRICT
     stderr_mode: OutputMode = OutputMode.STRICT
 
     skipped: bool = False
     timeout: Optional[float] = None
+    idle_timeout: Optional[float] = None
+    stop_on_mismatch: bool = False
+    io_mode: IOMode = IOMode.PIPE
+
+    _ref_output: Optional[ProcessOutput] = field(default=None, init=False, repr=False)
 
     def __post_init__(self):
         if isinstance(self.binary, str):
-            self.binary = pathlib.Path(self.binary).resolve()
+            self.binary = resolve(self.binary)
         if isinstance(self.stdout_mode, str):
-            self.stderr_mode = OutputMode[self.stdout_mode.upper()]
+            self.stdout_mode = OutputMode[self.stdout_mode.upper()]
         if isinstance(self.stderr_mode, str):
             self.stderr_mode = OutputMode[self.stderr_mode.upper()]
+        if isinstance(self.io_mode, str):
+            self.io_mode = IOMode(self.io_mode.lower())
+        # Files are memory-mapped when the test case runs, they are never
+        # loaded in memory
+        if self.stdin_file is not None:
+            self.stdin = FileOutput(pathlib.Path(self.stdin_file))
+        if self.stdout_file is not None:
+            self.stdout = FileOutput(pathlib.Path(self.stdout_file))
+        if self.stderr_file is not None:
+            self.stderr = FileOutput(pathlib.Path(self.stderr_file))
+        if self.stdin_generator is not None:
+            self.stdin = generators.from_spec(self.stdin_generator)
+
+    def _input(self) -> Optional[Stdin]:
+        """
+        The standard input. When it comes from an `Output`, it is only read
+        when the test case runs, and released once it is over. Files are
+        viewed through a memory mapping instead of being read, and generated
+        inputs are generated as they are written.
+        """
 
-        # The ref overrides undefined outputs
-        if self.ref is not None:
-            ref = pathlib.Path(self.ref).resolve()
-            process = subprocess.Popen(
-                [ref, *self.args],
-                stdin=subprocess.PIPE if self.stdin is not None else None,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
-            if self.stdin is not None:
-                process.stdin.write(self.stdin.encode())
-                process.stdin.close()
-            process.wait()
+        if isinstance(self.stdin, Input):
+            return self.stdin
+        if isinstance(self.stdin, Output):
+            return self.stdin.view()
+        return None if self.stdin is None else self.stdin.encode()
 
-            self.stdout = (
-                process.stdout.read().decode() if self.stdout is None else self.stdout
-            )
-            self.stderr = (
-                process.stderr.read().decode() if self.stderr is None else self.stderr
-            )
-            self.exit_code = (
-                process.returncode if self.exit_code is None else self.exit_code
-            )
+    def _start_ref(self, refs: RefRunner, stdin: Optional[Stdin]) -> Optional["Future[ProcessOutput]"]:
+        """
+        Start the ref, if any, in the background.
+        This is only done when the test case is run so that skipped test cases
+        never run their ref.
+
+        :param refs: The runner of the refs.
+        :param stdin: The standard input.
+        :return: A future holding the output of the ref, or <code>None</code>
+                 if there is nothing to run.
+        """
+
+        if self.ref is None or self._ref_output is not None:
+            return None
+
+        ref = pathlib.Path(self.ref).resolve()
+        return refs.submit(ref, self.args, stdin)
+
+    def _await_ref(self, pending_ref: Optional["Future[ProcessOutput]"]) -> bool:
+        """
+        Wait for the ref started by `_start_ref` and keep its output.
+
+        :param pending_ref: The future returned by `_start_ref`.
+        :return: <code>False</code> if the ref could not be run, else <code>True</code>.
+        """
+
+        if pending_ref is None:
+            return True
+
+        try:
+            self._ref_output = pending_ref.result()
+        except FileNotFoundError:
+            print(f"{self.ref}: No such file or directory.", decorations=(Fore.RED,))
+            return False
+        return True
+
+    def _release_ref(self):
+        """
+        Drop the output of the ref once the verdict is known, as the test suite
+        keeps its test cases until the end of the run.
+        """
+
+        self._ref_output = None
+
+    def _expected(self) -> ProcessOutput:
+        """
+        The expected outputs, the ones of the ref filling the undefined ones.
+        Outputs that are neither defined nor known from the ref are
+        <code>None</code>.
+        """
+
+        def as_output(value: Union[str, Output]) -> Output:
+            return value if isinstance(value, Output) else BytesOutput(value.encode())
+
+        ref = self._ref_output
+        stdout, stderr, exit_code = self.stdout, self.stderr, self.exit_code
+        return ProcessOutput(
+            stdout=as_output(stdout) if stdout is not None else ref and ref.stdout,
+            stderr=as_output(stderr) if stderr is not None else ref and ref.stderr,
+            exit_code=exit_code if exit_code is not None else ref and ref.exit_code,
+        )
+
+    @staticmethod
+    def _sink(mode: OutputMode, expected: Optional[Output],
+              options: RunOptions) -> Union[OutputComparator, CapturedStream]:
+        """
+        Where to write an output of the tested binary: straight to a comparator
+        if the expected output is already known, else to a captured stream so
+        that it can be compared later.
+        """
+
+        if expected is None:
+            return CapturedStream(options.memory_cap)
+        return mode.comparator(expected, options.diff_limits)
+
+    @staticmethod
+    def _compare(mode: OutputMode, expected: Optional[Output],
+                 sink: Union[OutputComparator, Output],
+                 options: RunOptions) -> Optional[OutputComparator]:
+        """
+        Get the comparator of an output written to `sink`, if it is to be tested.
+        """
+
+        if isinstance(sink, OutputComparator) or expected is None:
+            return sink if isinstance(sink, OutputComparator) else None
+        return mode.comparator(expected, options.diff_limits).feed(sink)
 
     @staticmethod
     def _print_command(name: str, args: List[str]):
@@ -171,16 +397,181 @@ class TestCase:
             print(" ".join(escaped), decorations=decorations, end="")
         print()
 
-    def run(self, verbosity: Verbosity) -> TestResult:
+    def run(self, verbosity: Verbosity,
+            options: Optional[RunOptions] = None) -> Tuple[TestResult, List[Mismatch]]:
         """
         Run the test case.
 
         :param verbosity: Output's verbosity.
-        :return: A <code>TestResult</code> representing the outcome of the test.
+        :param options: Options of the run - defaults to the default options.
+        :return: A <code>TestResult</code> representing the outcome of the test
+                 and the failed assertions, which are not rendered yet.
+        """
+
+        return self.start(verbosity, options).result()
+
+    def start(self, verbosity: Verbosity,
+              options: Optional[RunOptions] = None) -> "Future[Tuple[TestResult, List[Mismatch]]]":
+        """
+        Run the test case, but leave the assertions to the comparison pool of
+        the run if it has one, so that the caller is free to start another
+        test case meanwhile.
+
+        :param verbosity: Output's verbosity.
+        :param options: Options of the run - defaults to the default options.
+        :return: A future holding the same as `run`.
         """
 
         if self.skipped:
-            return TestResult.SKIPPED
+            return _completed((TestResult.SKIPPED, []))
+
+        options, stdin = self._prepare(verbosity, options)
+        pending_ref = self._start_ref(options.refs, stdin)
+        failed = self._ready(options.refs, pending_ref)
+        if failed is not None:
+            return failed
+
+        if self._uses_files(stdin):
+            try:
+                with self._files(stdin) as (stdin_file, stdout, stderr):
+                    process = subprocess.Popen(
+                        [self.binary, *self.args],
+                        stdin=stdin_file, stdout=stdout, stderr=stderr,
+                        start_new_session=True,
+                    )
+            except OSError as error:
+                return self._cannot_run(error)
+
+            with running(process.pid):
+                try:
+                    exit_code = process.wait(self.timeout)
+                except subprocess.TimeoutExpired:
+                    return self._timed_out(terminate(process, options.grace_period))
+
+            stdout, stderr, output = self._file_outputs(stdout, stderr, exit_code)
+        else:
+            try:
+                process = options.spawn(
+                    [self.binary, *self.args],
+                    # Own session, so that it can be killed with its children
+                    start_new_session=True,
+                )
+            except OSError as error:
+                return self._cannot_run(error)
+
+            stdout, stderr, stop = self._sinks(options)
+            run = communicate if options.supervisor is None else options.supervisor.communicate
+            with running(process.pid):
+                try:
+                    output = run(
+                        process, stdin, self.timeout, options.memory_cap, stdout, stderr, stop,
+                        self.idle_timeout,
+                    )
+                except subprocess.TimeoutExpired as error:
+                    return self._timed_out(
+                        terminate(process, options.grace_period),
+                        idle=isinstance(error, IdleTimeoutExpired),
+                    )
+
+        return self._conclude(stdout, stderr, output, pending_ref, verbosity, options)
+
+    async def start_async(self, verbosity: Verbosity,
+                          options: Optional[RunOptions] = None) -> "Future[Tuple[TestResult, List[Mismatch]]]":
+        """
+        Same as `start`, as a coroutine: the binary is driven by the event
+        loop running it instead of blocking a thread.
+
+        :param verbosity: Output's verbosity.
+        :param options: Options of the run - defaults to the default options.
+        :return: A future holding the same as `run`.
+        """
+
+        if self.skipped:
+            return _completed((TestResult.SKIPPED, []))
+
+        options, stdin = self._prepare(verbosity, options)
+        # A ref which is not concurrent runs right away, away from the event loop
+        pending_ref = await asyncio.to_thread(self._start_ref, options.refs, stdin)
+        failed = self._ready(options.refs, pending_ref)
+        if failed is not None:
+            return failed
+
+        if self._uses_files(stdin):
+            try:
+                with self._files(stdin) as (stdin_file, stdout, stderr):
+                    process = await aio.spawn(
+                        [self.binary, *self.args],
+                        stdin=stdin_file, stdout=stdout, stderr=stderr,
+                        start_new_session=True,
+                    )
+            except OSError as error:
+                return self._cannot_run(error)
+
+            with running(process.pid):
+                try:
+                    exit_code = await asyncio.wait_for(process.wait(), self.timeout)
+                except asyncio.TimeoutError:
+                    return self._timed_out(await aio.terminate(process, options.grace_period))
+
+            stdout, stderr, output = self._file_outputs(stdout, stderr, exit_code)
+        else:
+            try:
+                process = await aio.spawn(
+                    [self.binary, *self.args],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    # Own session, so that it can be killed with its children
+                    start_new_session=True,
+                )
+            except OSError as error:
+                return self._cannot_run(error)
+
+            stdout, stderr, stop = self._sinks(options)
+            with running(process.pid):
+                try:
+                    output = await aio.communicate(
+                        process, stdin, self.timeout, options.memory_cap, stdout, stderr, stop,
+                        self.idle_timeout,
+                    )
+                except subprocess.TimeoutExpired as error:
+                    return self._timed_out(
+                        await aio.terminate(process, options.grace_period),
+                        idle=isinstance(error, IdleTimeoutExpired),
+                    )
+
+        if options.refs.concurrent and pending_ref is not None:
+            await asyncio.wrap_future(pending_ref)
+        return self._conclude(stdout, stderr, output, pending_ref, verbosity, options)
+
+    def _prepare(self, verbosity: Verbosity,
+                 options: Optional[RunOptions]) -> Tuple[RunOptions, Optional[Stdin]]:
+        """Announce the test case, and get the options of the run and the standard input."""
+
+        self._announce(verbosity)
+        options = RunOptions() if options is None else options
+        return options, self._input()
+
+    def _ready(self, refs: RefRunner,
+               pending_ref: Optional["Future[ProcessOutput]"]) -> Optional["Future[Tuple[TestResult, List[Mismatch]]]"]:
+        """
+        Check that the binary can be started, once the ref is over unless they
+        run concurrently.
+
+        :return: The result of the test case if it cannot, `None` otherwise.
+        """
+
+        if not refs.concurrent and not self._await_ref(pending_ref):
+            return _completed((TestResult.ERROR, []))
+
+        try:
+            check_executable(self.binary)
+        except OSError as error:
+            return self._cannot_run(error)
+        return None
+
+    def _announce(self, verbosity: Verbosity):
+        """Print the commands about to be run, if verbose."""
 
         if verbosity is Verbosity.VERBOSE:
             print("testing:", decorations=(Style.DIM,))
@@ -189,61 +580,212 @@ class TestCase:
                 print("against:", decorations=(Style.DIM,))
                 self._print_command(self.ref, self.args)
 
-        try:
-            process = subprocess.Popen(
-                [self.binary, *self.args],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+    def _sinks(self, options: RunOptions) -> Tuple[Union[OutputComparator, CapturedStream],
+                                                   Union[OutputComparator, CapturedStream],
+                                                   Optional[Callable[[], bool]]]:
+        """
+        Where to write the standard output and error of the tested binary, see
+        `_sink`, and when to stop it if it is stopped on the first mismatch.
+        """
+
+        expected = self._expected()
+        stdout = self._sink(self.stdout_mode, expected.stdout, options)
+        stderr = self._sink(self.stderr_mode, expected.stderr, options)
+        comparators = [s for s in (stdout, stderr) if isinstance(s, OutputComparator)]
+        stop = None
+        if self.stop_on_mismatch:
+            stop = lambda: any(comparator.diverged for comparator in comparators)
+        return stdout, stderr, stop
+
+    def _cannot_run(self, error: OSError) -> "Future[Tuple[TestResult, List[Mismatch]]]":
+        """Report that the binary could not be started, see `process.check_executable`."""
+
+        self._release_ref()
+        if isinstance(error, PermissionError):
+            reason = "Permission denied"
+        elif isinstance(error, FileNotFoundError):
+            reason = "No such file or directory"
+        else:
+            reason = error.strerror or str(error)
+        print(f"{self.binary}: {reason}.", decorations=(Fore.RED,))
+        return _completed((TestResult.ERROR, []))
+
+    def _timed_out(self, leftovers: List[int],
+                   idle: bool = False) -> "Future[Tuple[TestResult, List[Mismatch]]]":
+        """
+        Report a timeout, once the binary and its process group are killed.
+
+        :param leftovers: The descendants of the binary still running, see `process.terminate`.
+        :param idle: Indicates if the idle timeout expired rather than the timeout.
+        """
+
+        self._release_ref()
+        print(
+            f"{self.idle_timeout}s without output exceeded" if idle
+            else f"{self.timeout}s timeout exceeded",
+            decorations=(Style.BRIGHT, Fore.RED),
+        )
+        if leftovers:
+            print(
+                f"{len(leftovers)} descendant(s) left running: "
+                + " ".join(map(str, leftovers)),
+                decorations=(Fore.RED,),
             )
-        except FileNotFoundError:
-            print(f"{self.binary}: No such file or directory.", decorations=(Fore.RED,))
-            return TestResult.ERROR
+        return _completed((TestResult.FAILURE, []))
+
+    def _uses_files(self, stdin: Optional[Stdin]) -> bool:
+        """Indicate if the binary is given files instead of pipes, see `IOMode`."""
+
+        return (self.io_mode is IOMode.FILE
+                and not isinstance(stdin, Input)
+                and not self.stop_on_mismatch
+                and self.idle_timeout is None)
 
+    @contextlib.contextmanager
+    def _files(self, stdin: Optional[Union[bytes, memoryview]]) -> Iterator[Tuple[Any, IO[bytes], IO[bytes]]]:
+        """
+        The files given to the binary in FILE mode, while it is started: its
+        standard input, and temporary files for its outputs. The input file is
+        closed once the binary started, and the output files if it could not.
+        """
+
+        if stdin is None:
+            stdin_file = subprocess.DEVNULL
+        elif isinstance(self.stdin, FileOutput):
+            # Zero-copy: the binary reads the input file itself
+            stdin_file = self.stdin._open()
+        else:
+            stdin_file = temporary_file(stdin)
+        stdout, stderr = temporary_file(), temporary_file()
         try:
-            stdin = None if self.stdin is None else self.stdin.encode()
-            stdout, stderr = process.communicate(stdin, timeout=self.timeout)
-        except subprocess.TimeoutExpired:
+            yield stdin_file, stdout, stderr
+        except BaseException:
+            stdout.close()
+            stderr.close()
+            raise
+        finally:
+            if stdin_file is not subprocess.DEVNULL:
+                stdin_file.close()
+
+    @staticmethod
+    def _file_outputs(stdout: IO[bytes], stderr: IO[bytes],
+                      exit_code: int) -> Tuple[Output, Output, ProcessOutput]:
+        """
+        The outputs the binary wrote to the files of `_files`. They keep the
+        temporary files, which are deleted once they are released.
+        """
+
+        stdout, stderr = TemporaryFileOutput(stdout), TemporaryFileOutput(stderr)
+        return stdout, stderr, ProcessOutput(stdout, stderr, exit_code)
+
+    def _conclude(self, stdout: Union[OutputComparator, Output],
+                  stderr: Union[OutputComparator, Output], output: ProcessOutput,
+                  pending_ref: Optional["Future[ProcessOutput]"], verbosity: Verbosity,
+                  options: RunOptions) -> "Future[Tuple[TestResult, List[Mismatch]]]":
+        """Run the assertions once the binary is over, in the comparison pool if any."""
+
+        if output.stopped:
             print(
-                f"{self.timeout}s timeout exceeded",
+                "stopped on the first mismatch",
                 decorations=(Style.BRIGHT, Fore.RED),
             )
-            return TestResult.FAILURE
 
-        exit_code = process.returncode
+        if options.refs.concurrent and not self._await_ref(pending_ref):
+            return _completed((TestResult.ERROR, []))
 
-        return self.__run_assertions(stdout.decode(), stderr.decode(), exit_code)
+        check = functools.partial(self.__check, stdout, stderr, output, verbosity, options)
+        if options.comparisons is None:
+            return _completed(check())
+        return options.comparisons.submit(check)
 
-    def __run_assertions(self, stdout: str, stderr: str, exit_code: int) -> TestResult:
-        passing = True
+    def __check(self, stdout: Union[OutputComparator, Output],
+                stderr: Union[OutputComparator, Output], output: ProcessOutput,
+                verbosity: Verbosity, options: RunOptions) -> Tuple[TestResult, List[Mismatch]]:
+        """
+        Run the assertions once the binary is over.
+        Failures are rendered right away unless they will not be printed, so
+        that reporting them costs nothing.
+        """
 
-        # I use & instead of `and` because I don't want any assertion skipped
-        if self.stdout is not None:
-            passing &= pretty_assert(
-                "standard outputs",
-                actual=stdout,
-                expected=self.stdout,
-                compare=self.stdout_mode.compare_outputs,
-            )
-        if self.stderr is not None:
-            passing &= pretty_assert(
-                "standard errors",
-                actual=stderr,
-                expected=self.stderr,
-                compare=self.stderr_mode.compare_outputs,
+        # With a concurrent ref, outputs could only be captured and are
+        # compared now that the ref is over
+        expected = self._expected()
+        try:
+            result, mismatches = self.__run_assertions(
+                self._compare(self.stdout_mode, expected.stdout, stdout, options),
+                self._compare(self.stderr_mode, expected.stderr, stderr, options),
+                output.exit_code,
+                # The exit code of a killed binary means nothing
+                None if output.stopped else expected.exit_code,
             )
-        if self.exit_code is not None:
-            passing &= pretty_assert(
+        finally:
+            self._release_ref()
+        if verbosity is not Verbosity.SILENT:
+            for mismatch in mismatches:
+                mismatch.explain()
+        return result, mismatches
+
+    def __run_assertions(self, stdout: Optional[OutputComparator],
+                         stderr: Optional[OutputComparator], exit_code: int,
+                         expected_exit_code: Optional[int]) -> Tuple[TestResult, List[Mismatch]]:
+        mismatches = []
+
+        if stdout is not None:
+            mismatches.append(stdout.result("standard outputs"))
+        if stderr is not None:
+            mismatches.append(stderr.result("standard errors"))
+        if expected_exit_code is not None and exit_code != expected_exit_code:
+            mismatches.append(Mismatch(
                 "exit codes",
-                actual=exit_code,
-                expected=self.exit_code,
-                compare=lambda actual, expected: None
-                if actual == expected
-                else f"expected {decorate(expected, Fore.GREEN)}, "
-                f"got {decorate(actual, Fore.RED)}",
-            )
+                lambda colored: f"expected {expected_exit_code}, got {exit_code}"
+                if not colored
+                else f"expected {decorate(expected_exit_code, Fore.GREEN)}, "
+                f"got {decorate(exit_code, Fore.RED)}",
+            ))
+
+        mismatches = [mismatch for mismatch in mismatches if mismatch is not None]
+        return TestResult.FAILURE if mismatches else TestResult.SUCCESS, mismatches
+
+
+@dataclass
+class TestOutcome:
+    """
+    What running a test case produced.
+
+    Arguments
+    ---------
+        verdict         The result of the test case and its failed assertions,
+                        which may still be computed
+        output          Everything the test case printed
+        elapsed_time    Time spent running the test case, setup and teardown included
+    """
+
+    verdict: "Future[Tuple[TestResult, List[Mismatch]]]"
+    output: str
+    elapsed_time: float
+
+    @property
+    def result(self) -> TestResult:
+        """The result of the test case, waiting for the assertions if needed."""
+
+        return self.verdict.result()[0]
+
+    @property
+    def mismatches(self) -> List[Mismatch]:
+        """The failed assertions, waiting for them if needed."""
+
+        return self.verdict.result()[1]
+
+    def report(self, colored: bool = True) -> str:
+        """
+        Render everything to show under the test case: what it printed
+        followed by the reports of its failed assertions.
+
+        :param colored: Indicates if the report is decorated with colors.
+        """
 
-        return TestResult.SUCCESS if passing else TestResult.FAILURE
+        output = self.output if colored else remove_decorations(self.output)
+        return output + "".join(mismatch.report(colored) for mismatch in self.mismatches)
 
 
 @dataclass
@@ -259,6 +801,8 @@ class TestSuite:
         teardown    (optional) Command to execute after each test case.
         fatal       Indicates if a failure in a test case means an abortion of the runner - defaults to false.
         verbosity   Output's verbosity - defaults to NORMAL
+        jobs        Number of test cases run concurrently - defaults to 1
+        options     Options of the run, shared by all test suites - defaults to the default options
     """
 
     name: str
@@ -269,9 +813,42 @@ class TestSuite:
 
     fatal: bool = False
     verbosity: Verbosity = Verbosity.NORMAL
+    jobs: int = 1
+    options: RunOptions = field(default_factory=RunOptions)
 
     def __post_init__(self):
-        self.junit_test_suite = jxml.TestSuite(name=self.name)
+        self._reported: List[Tuple[TestCase, TestOutcome]] = []
+
+    @property
+    def junit_test_suite(self) -> jxml.TestSuite:
+        """
+        The JUnit test suite of the reported test cases.
+        Failures are rendered for JUnit only when this is built.
+        """
+
+        junit_test_suite = jxml.TestSuite(name=self.name)
+        for test, outcome in self._reported:
+            jxml_testcase = jxml.TestCase(
+                name=test.name,
+                classname=f"{self.name}.{test.name}",
+                elapsed_sec=outcome.elapsed_time,
+            )
+            if outcome.result == TestResult.FAILURE:
+                if self.verbosity is not Verbosity.SILENT:
+                    jxml_testcase.add_failure_info(
+                        message="Test failed",
+                        output=outcome.report(colored=False),
+                    )
+            elif outcome.result == TestResult.ERROR:
+                if self.verbosity is not Verbosity.SILENT:
+                    jxml_testcase.add_error_info(
+                        message="Internal error",
+                        output=outcome.report(colored=False),
+                    )
+            elif outcome.result == TestResult.SKIPPED:
+                jxml_testcase.add_error_info(message="Test skipped")
+            junit_test_suite.test_cases.append(jxml_testcase)
+        return junit_test_suite
 
     def __setup(self):
         if self.setup is not None:
@@ -281,11 +858,88 @@ class TestSuite:
         if self.teardown is not None:
             subprocess.run(self.teardown.split())
 
+    @staticmethod
+    async def __run_async(command: Optional[str]):
+        if command is not None:
+            process = await asyncio.create_subprocess_exec(*command.split())
+            await process.wait()
+
     def add_test(self, test: TestCase):
         """Add a test case at the end of the test suite"""
 
         self.tests.append(test)
 
+    def _execute(self, test: TestCase) -> TestOutcome:
+        """
+        Run a single test case surrounded by the setup and the teardown.
+        Everything printed meanwhile is buffered, which makes it safe to call
+        from several threads at once.
+
+        :param test: The test case to run.
+        :return: The outcome of the test case.
+        """
+
+        io.disable_stdout()
+        try:
+            start_time = time.time()
+
+            self.__setup()
+            verdict = test.start(self.verbosity, self.options)
+            self.__teardown()
+
+            stop_time = time.time()
+            elapsed_time = (stop_time - start_time) / 1000
+            return TestOutcome(verdict, sys.stdout.read(), elapsed_time)
+        finally:
+            io.enable_stdout()
+
+    async def _execute_async(self, test: TestCase) -> TestOutcome:
+        """Same as `_execute`, as a coroutine, see `TestCase.start_async`."""
+
+        io.disable_stdout()
+        try:
+            start_time = time.time()
+
+            await self.__run_async(self.setup)
+            verdict = await test.start_async(self.verbosity, self.options)
+            await self.__run_async(self.teardown)
+
+            stop_time = time.time()
+            elapsed_time = (stop_time - start_time) / 1000
+            return TestOutcome(verdict, sys.stdout.read(), elapsed_time)
+        finally:
+            io.enable_stdout()
+
+    def schedule(self, scheduler: Union[Scheduler, aio.AsyncScheduler]) -> List["Future[Optional[TestOutcome]]"]:
+        """
+        Schedule all the tests of the testsuite.
+        If the testsuite is fatal, a failure aborts the whole run.
+
+        :param scheduler: The scheduler running the test cases, as coroutines
+                          if it is an `aio.AsyncScheduler`.
+        :return: The futures of the outcomes, in the same order as the tests.
+        """
+
+        def watch(outcome: TestOutcome) -> TestOutcome:
+            if self.fatal:
+                # Do not wait for the assertions, they may not be over yet
+                index = scheduler.current
+                outcome.verdict.add_done_callback(
+                    lambda verdict: verdict.exception() is None
+                    and verdict.result()[0] is TestResult.FAILURE
+                    and scheduler.abort(index)
+                )
+            return outcome
+
+        if isinstance(scheduler, aio.AsyncScheduler):
+            async def execute(test: TestCase) -> TestOutcome:
+                return watch(await self._execute_async(test))
+        else:
+            def execute(test: TestCase) -> TestOutcome:
+                return watch(self._execute(test))
+
+        return [scheduler.submit(functools.partial(execute, test)) for test in self.tests]
+
     def run(self):
         """
         Run all the tests in the testsuite
@@ -293,87 +947,118 @@ class TestSuite:
         :return: Returns 0 if all tests succeeded, else 1
         """
 
+        with Scheduler(self.jobs) as scheduler:
+            futures = self.schedule(scheduler)
+            return self.report(future.result() for future in futures)
+
+    def report(self, outcomes: Iterable[TestOutcome]):
+        """
+        Print the outcomes of the test cases in order and record them for the
+        JUnit test suite.
+
+        :param outcomes: The outcomes of the test cases, in the same order as
+                         the test cases. They are only consumed one by one so
+                         they can be computed lazily.
+        :return: Returns 0 if all tests succeeded, else 1
+        """
+
         print(
             f"- Running test suite '{self.name}':\n",
             decorations=(Style.BRIGHT, Fore.LIGHTBLUE_EX),
         )
 
         total = len(self.tests)
+        # used to align everything
+        max_name_length = max((len(test.name) for test in self.tests), default=0)
         exit_code = 0
+        outcomes = iter(outcomes)
         for no, test in enumerate(self.tests):
-            # used to align everything
-            max_name_length = max(len(test.name) for test in self.tests)
             print(
                 f"{no + 1}/{total}",
                 decorate(test.name, Style.BRIGHT),
                 end=f'{" " * (max_name_length - len(test.name))}\t',
+                flush=True,
             )
 
-            io.disable_stdout()
-            start_time = time.time()
-
-            self.__setup()
-            result = test.run(self.verbosity)
-            self.__teardown()
-
-            stop_time = time.time()
-            elapsed_time = (stop_time - start_time) / 1000
-            test_output = sys.stdout.read()
-            io.enable_stdout()
-
-            jxml_testcase = jxml.TestCase(
-                name=test.name,
-                classname=f"{self.name}.{test.name}",
-                elapsed_sec=elapsed_time,
-            )
+            outcome = next(outcomes)
+            self._reported.append((test, outcome))
+            result = outcome.result
             if result == TestResult.SUCCESS:
                 print("OK", decorations=(Style.BRIGHT, Fore.LIGHTGREEN_EX))
                 if self.verbosity is Verbosity.VERBOSE:
-                    print(test_output)
+                    print(outcome.report())
             elif result == TestResult.FAILURE:
                 print("KO", decorations=(Style.BRIGHT, Fore.LIGHTRED_EX))
                 if self.verbosity is not Verbosity.SILENT:
-                    print(test_output)
-                    jxml_testcase.add_failure_info(
-                        message="Test failed",
-                        output=remove_decorations(test_output),
-                    )
+                    print(outcome.report())
                 if self.fatal:
                     raise InterruptedError()
                 exit_code = 1
             elif result == TestResult.ERROR:
                 print("INTERNAL ERROR", decorations=(Style.BRIGHT, Fore.LIGHTYELLOW_EX))
                 if self.verbosity is not Verbosity.SILENT:
-                    print(test_output)
-                    jxml_testcase.add_error_info(
-                        message="Internal error",
-                        output=remove_decorations(test_output),
-                    )
+                    print(outcome.report())
             elif result == TestResult.SKIPPED:
-                jxml_testcase.add_error_info(message="Test skipped")
                 print("SKIPPED", decorations=(Style.BRIGHT, Fore.BLUE))
-            self.junit_test_suite.test_cases.append(jxml_testcase)
 
         return exit_code
 
 
+def _parse_jobs(value: str) -> int:
+    """
+    Parse the value of the `--jobs` option.
+
+    :param value: Either a positive integer or 'auto'.
+    :return: The number of jobs, 'auto' being the number of CPUs.
+    """
+
+    if value == "auto":
+        return os.cpu_count() or 1
+
+    try:
+        jobs = int(value)
+    except ValueError:
+        jobs = 0
+    if jobs < 1:
+        raise argparse.ArgumentTypeError(
+            f"expected a positive integer or 'auto', got '{value}'"
+        )
+    return jobs
+
+
 def get_testsuites():
     """
     Read the arguments from the command line and generate a test suite.
 
-    :return: Returns the generated test suite.
+    :return: Returns the generated test suites, the command line arguments and
+             the options of the run, to close once the test suites are over.
     """
 
     # 1- Parse the command line arguments
     parser = argparse.ArgumentParser()
-    parser.add_argument(
+    tests = parser.add_mutually_exclusive_group(required=True)
+    tests.add_argument(
         "-f",
         "--test-file",
         type=pathlib.Path,
-        required=True,
         metavar="<path>",
         help="Path to the YAML test file.",
     )
+    tests.add_argument(
+        "-d",
+        "--test-dir",
+        type=pathlib.Path,
+        metavar="<path>",
+        help="Path to a directory of test files, named after their test case "
+        "with the extensions .args, .in, .out, .err and .code.",
+    )
+    parser.add_argument(
+        "--binary",
+        type=pathlib.Path,
+        required=False,
+        metavar="<path>",
+        help="Path to the tested binary, required with --test-dir.",
+    )
     parser.add_argument(
         "--verbosity",
         type=Verbosity,
@@ -389,25 +1074,222 @@ def get_testsuites():
         metavar="<path>",
         help="Optional path to a JUnit XML file in which to write the output.",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=_parse_jobs,
+        required=False,
+        default=1,
+        metavar="<N|auto>",
+        help="Number of test cases run concurrently across all test suites, "
+        "'auto' uses one per CPU. Defaults to 1.",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["threads", "asyncio"],
+        required=False,
+        default="threads",
+        metavar="<threads|asyncio>",
+        help="How the --jobs test cases are run concurrently: on as many "
+        "threads, or as coroutines of a single asyncio event loop, defaults to "
+        "threads.",
+    )
+    parser.add_argument(
+        "--spawn",
+        choices=list(SPAWNERS),
+        required=False,
+        default="popen",
+        metavar=f"<{'|'.join(SPAWNERS)}>",
+        help="How the tested executables are started with the threads engine: "
+        "with subprocess.Popen, or straight with os.posix_spawn, defaults to "
+        "popen.",
+    )
+    parser.add_argument(
+        "--ref-cache",
+        type=pathlib.Path,
+        required=False,
+        default=default_directory(),
+        metavar="<path>",
+        help="Directory in which the outputs of the refs are cached, "
+        "defaults to '%(default)s'.",
+    )
+    parser.add_argument(
+        "--ref-cache-size",
+        type=int,
+        required=False,
+        default=DEFAULT_MAX_SIZE // (1024 * 1024),
+        metavar="<MiB>",
+        help="Size above which the least recently used outputs are evicted "
+        "from the cache, defaults to %(default)s MiB.",
+    )
+    parser.add_argument(
+        "--no-ref-cache",
+        action="store_true",
+        help="Always run the refs instead of using the cache.",
+    )
+    parser.add_argument(
+        "--plan-cache",
+        type=pathlib.Path,
+        required=False,
+        default=plan_directory(),
+        metavar="<path>",
+        help="Directory in which the parsed test files are cached, "
+        "defaults to '%(default)s'.",
+    )
+    parser.add_argument(
+        "--no-plan-cache",
+        action="store_true",
+        help="Always parse the test file instead of using the cache.",
+    )
+    parser.add_argument(
+        "--compare-jobs",
+        type=_parse_jobs,
+        required=False,
+        default="auto",
+        metavar="<N|auto>",
+        help="Number of threads running the assertions and rendering the "
+        "failures, defaults to 'auto', i.e. one per CPU.",
+    )
+    parser.add_argument(
+        "--memory-cap",
+        type=int,
+        required=False,
+        default=DEFAULT_MEMORY_CAP // (1024 * 1024),
+        metavar="<MiB>",
+        help="Size of each output kept in memory, beyond which it is spilled "
+        "to a temporary file, 0 spilling everything, defaults to %(default)s MiB.",
+    )
+    parser.add_argument(
+        "--diff-context",
+        type=int,
+        required=False,
+        default=DiffLimits.context,
+        metavar="<lines>",
+        help="Number of unchanged lines shown around each difference, "
+        "defaults to %(default)s.",
+    )
+    parser.add_argument(
+        "--diff-max-hunks",
+        type=int,
+        required=False,
+        default=DiffLimits.max_hunks,
+        metavar="<N>",
+        help="Number of hunks beyond which a diff is summarized, "
+        "defaults to %(default)s.",
+    )
+    parser.add_argument(
+        "--diff-max-bytes",
+        type=int,
+        required=False,
+        default=DiffLimits.max_bytes,
+        metavar="<bytes>",
+        help="Size beyond which a diff is summarized, defaults to %(default)s.",
+    )
+    parser.add_argument(
+        "--stop-on-mismatch",
+        action="store_true",
+        help="Kill the tested executables as soon as an output cannot match "
+        "anymore, unless their test case sets 'stop_on_mismatch' to false.",
+    )
+    parser.add_argument(
+        "--concurrent-ref",
+        action="store_true",
+        help="Run each ref at the same time as the tested executable "
+        "instead of before it.",
+    )
+    parser.add_argument(
+        "--io-mode",
+        type=IOMode,
+        choices=list(IOMode),
+        required=False,
+        default=None,
+        metavar="<pipe|file>",
+        help="How the tested executables are given their standard input and "
+        "outputs, unless their test case sets 'io_mode', defaults to pipe.",
+    )
+    parser.add_argument(
+        "--grace-period",
+        type=float,
+        required=False,
+        default=DEFAULT_GRACE_PERIOD,
+        metavar="<seconds>",
+        help="Time given to the tested executables that timed out to exit "
+        "after SIGTERM, before their process group is killed, defaults to "
+        "%(default)ss.",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        required=False,
+        default=None,
+        metavar="<seconds>",
+        help="Kill the tested executables that output nothing for that long, "
+        "unless their test case sets 'idle_timeout', defaults to never.",
+    )
 
     cmd_args = parser.parse_args()
 
-    # 2- Read the YAML file
-    with open(cmd_args.test_file.resolve(), "r") as file:
-        try:
-            yaml_content = yaml.safe_load(file)
-        except yaml.YAMLError as error:
-            print(error, file=sys.stderr)
-            exit(1)
+    # 2- Read the YAML file, unless its plan is cached, or discover the tests
+    if cmd_args.test_dir is not None:
+        if cmd_args.binary is None:
+            parser.error("--binary is required with --test-dir")
+        defaults = {"binary": cmd_args.binary.resolve()}
+        plan_testsuites = discover(cmd_args.test_dir, defaults)
+    else:
+        start_time = time.perf_counter()
+        plans = None if cmd_args.no_plan_cache else PlanCache(cmd_args.plan_cache)
+        plan_testsuites, cached = load_plan(cmd_args.test_file, plans)
+        if cmd_args.verbosity is Verbosity.VERBOSE:
+            if cached:
+                elapsed_time = time.perf_counter() - start_time
+                print(f"Loaded the cached plan of {cmd_args.test_file} "
+                      f"in {elapsed_time:.3f}s", decorations=(Style.DIM,))
+            else:
+                print(f"Parsing {cmd_args.test_file} with {loader.loader_name()}",
+                      decorations=(Style.DIM,))
 
     # 3- Setup the tests
-    testsuites = []
-    defaults = yaml_content.get("default", {})
-    for yaml_testsuite in yaml_content["testsuites"]:
-        yaml_testsuite["tests"] = [
-            TestCase(**{**defaults, **test}) for test in yaml_testsuite["tests"]
-        ]
-        testsuite = TestSuite(verbosity=cmd_args.verbosity, **yaml_testsuite)
-        testsuites.append(testsuite)
-
-    return testsuites, cmd_args.junit_file
+    cache = None
+    if not cmd_args.no_ref_cache:
+        cache = RefCache(cmd_args.ref_cache, cmd_args.ref_cache_size * 1024 * 1024)
+    memory_cap = cmd_args.memory_cap * 1024 * 1024
+    # The event loop of the asyncio engine already drives the binaries, and a
+    # single worker is faster driving its binary itself
+    supervised = cmd_args.engine == "threads" and cmd_args.jobs > 1 and Supervisor.supported()
+    options = RunOptions(
+        refs=RefRunner(cache, cmd_args.concurrent_ref, memory_cap),
+        memory_cap=memory_cap,
+        diff_limits=DiffLimits(
+            context=cmd_args.diff_context,
+            max_hunks=cmd_args.diff_max_hunks,
+            max_bytes=cmd_args.diff_max_bytes,
+        ),
+        comparisons=ThreadPoolExecutor(
+            max_workers=cmd_args.compare_jobs, thread_name_prefix="refery-compare"
+        ),
+        supervisor=Supervisor() if supervised else None,
+        spawn=SPAWNERS[cmd_args.spawn],
+        grace_period=cmd_args.grace_period,
+    )
+
+    def testsuites() -> Iterator[TestSuite]:
+        try:
+            for plan_testsuite in plan_testsuites:
+                tests = plan_testsuite["tests"]
+                if cmd_args.stop_on_mismatch:
+                    tests = [{"stop_on_mismatch": True, **test} for test in tests]
+                if cmd_args.io_mode is not None:
+                    tests = [{"io_mode": cmd_args.io_mode, **test} for test in tests]
+                if cmd_args.idle_timeout is not None:
+                    tests = [{"idle_timeout": cmd_args.idle_timeout, **test} for test in tests]
+                yield TestSuite(
+                    verbosity=cmd_args.verbosity,
+                    jobs=cmd_args.jobs,
+                    options=options,
+                    **{**plan_testsuite, "tests": [TestCase(**test) for test in tests]},
+                )
+        except (yaml.YAMLError, DiscoveryError, OSError, ValueError) as error:
+            # Reported by the main thread, after the test suites already parsed
+            raise TestFileError(error) from error
+
+    return testsuites(), cmd_args, options
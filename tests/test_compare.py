@@ -0,0 +1,109 @@
+import random
+from typing import Iterator
+
+import pytest
+
+from refery.capture import BytesOutput, Output
+from refery.compare import ExistenceComparator, StrictComparator
+
+
+class ChunkedOutput(Output):
+    """An output read by chunks of random sizes, to move the chunk boundaries around."""
+
+    def __init__(self, data: bytes, seed: int):
+        self.data = data
+        self.size = len(data)
+        self.seed = seed
+
+    def chunks(self, chunk_size: int = 0) -> Iterator[bytes]:
+        rng = random.Random(self.seed)
+        offset = 0
+        while offset < self.size:
+            length = rng.randrange(1, 100)
+            yield self.data[offset:offset + length]
+            offset += length
+
+
+def _compare(expected: bytes, actual: bytes, seed: int, window: int = 64) -> StrictComparator:
+    comparator = StrictComparator(ChunkedOutput(expected, seed), window=window)
+    rng = random.Random(-seed)
+    offset = 0
+    while offset < len(actual):
+        length = rng.randrange(1, 100)
+        comparator.write(actual[offset:offset + length])
+        offset += length
+    return comparator
+
+
+def _lines(count: int) -> bytes:
+    return b"".join(b"line %d\n" % index for index in range(1, count + 1))
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_same_outputs_match(seed):
+    data = _lines(random.Random(seed).randrange(200))
+    comparator = _compare(data, data, seed)
+    assert not comparator.diverged
+    assert comparator.result("outputs") is None
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_different_outputs_mismatch(seed):
+    rng = random.Random(seed)
+    expected = _lines(rng.randrange(1, 200))
+    position = rng.randrange(len(expected))
+    actual = bytearray(expected)
+    action = rng.choice(["change", "truncate", "extend"])
+    if action == "change":
+        actual[position] ^= 1
+    elif action == "truncate":
+        del actual[position:]
+    else:
+        actual += b"more\n"
+
+    comparator = _compare(expected, bytes(actual), seed)
+    # A shorter output only diverges once it is over
+    assert comparator.diverged == (action != "truncate")
+    mismatch = comparator.result("outputs")
+    assert mismatch is not None
+    assert mismatch.explain(colored=False)
+
+
+def test_the_diff_of_a_small_output_is_complete():
+    comparator = _compare(b"a\nb\nc\n", b"a\nx\nc\n", seed=0)
+    assert comparator.result("outputs").explain(colored=False).splitlines() == [
+        "--- got",
+        "+++ expected",
+        "@@ -1,3 +1,3 @@",
+        " a↵",
+        "-x↵",
+        "+b↵",
+        " c↵",
+    ]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_windowed_diffs_show_the_actual_line_numbers(seed):
+    expected = _lines(10000)
+    actual = expected.replace(b"line 5001\n", b"LINE 5001\n")
+    report = _compare(expected, actual, seed, window=4096).result("outputs").explain(colored=False)
+    header, *diff = report.splitlines()
+    assert header.startswith("first difference at line 5001 ")
+    hunk = next(line for line in diff if line.startswith("@@"))
+    assert hunk == "@@ -4998,7 +4998,7 @@"
+    assert "-LINE 5001↵" in diff
+    assert "+line 5001↵" in diff
+
+
+def test_existence():
+    assert ExistenceComparator(BytesOutput(b"")).result("outputs") is None
+    assert ExistenceComparator(BytesOutput(b"a")).feed(BytesOutput(b"b")).result("outputs") is None
+
+    comparator = ExistenceComparator(BytesOutput(b""))
+    comparator.write(b"a")
+    assert comparator.diverged
+    assert comparator.result("outputs").explain() == "expected nothing, got something"
+
+    comparator = ExistenceComparator(BytesOutput(b"a"))
+    assert not comparator.diverged
+    assert comparator.result("outputs").explain() == "expected something, got nothing"
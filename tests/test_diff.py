@@ -0,0 +1,108 @@
+import difflib
+import random
+from typing import List, Sequence
+
+import pytest
+
+from refery.diff import Opcode, diff, group
+
+
+def _check_opcodes(a: Sequence[str], b: Sequence[str], opcodes: List[Opcode]):
+    """Check that opcodes turn `a` into `b` the way difflib's do."""
+
+    i = j = 0
+    previous = None
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j), "opcodes must be contiguous"
+        assert i1 <= i2 and j1 <= j2
+        assert (i1, j1) != (i2, j2), "opcodes must not be empty"
+        if tag == "equal":
+            assert a[i1:i2] == b[j1:j2]
+            assert previous != "equal", "equal opcodes must be merged"
+        elif tag == "replace":
+            assert i1 < i2 and j1 < j2
+        elif tag == "delete":
+            assert i1 < i2 and j1 == j2
+        elif tag == "insert":
+            assert i1 == i2 and j1 < j2
+        else:
+            pytest.fail(f"unknown tag {tag}")
+        i, j, previous = i2, j2, tag
+    assert (i, j) == (len(a), len(b)), "opcodes must cover both sequences"
+
+
+def _mutate(rng: random.Random, lines: List[str], alphabet: str) -> List[str]:
+    lines = list(lines)
+    for _ in range(rng.randrange(5)):
+        position = rng.randrange(len(lines) + 1)
+        action = rng.choice(["insert", "delete", "replace"])
+        if action == "insert" or not lines:
+            lines[position:position] = [rng.choice(alphabet) for _ in range(rng.randrange(1, 4))]
+        elif action == "delete":
+            del lines[position:position + rng.randrange(1, 4)]
+        else:
+            lines[position:position + 1] = [rng.choice(alphabet)]
+    return lines
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_diffs_are_valid(seed):
+    rng = random.Random(seed)
+    # Few distinct lines, so that both the patience anchors and the Myers
+    # fallback are exercised
+    alphabet = "abcdefghij"[:rng.randrange(2, 11)]
+    a = [rng.choice(alphabet) for _ in range(rng.randrange(40))]
+    b = _mutate(rng, a, alphabet)
+    _check_opcodes(a, b, diff(a, b))
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_costly_regions_are_replaced_as_a_whole(seed):
+    rng = random.Random(seed)
+    a = [rng.choice("ab") for _ in range(200)]
+    b = [rng.choice("ab") for _ in range(200)]
+    _check_opcodes(a, b, diff(a, b, max_cost=4))
+
+
+@pytest.mark.parametrize("a, b", [
+    ([], []),
+    ([], ["a"]),
+    (["a"], []),
+    (["a", "b"], ["a", "b"]),
+    (["a", "b", "c"], ["a", "x", "c"]),
+    (["a", "b", "c"], ["a", "c"]),
+    (["a", "c"], ["a", "b", "c"]),
+    (["a", "b", "c"], ["x", "y", "z"]),
+])
+def test_simple_diffs_match_difflib(a, b):
+    expected = difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes()
+    if not a and not b:
+        # difflib describes two empty sequences as one empty equal opcode
+        expected = []
+    assert diff(a, b) == expected
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_single_changes_match_difflib(seed):
+    rng = random.Random(seed)
+    a = [f"line {index}" for index in range(rng.randrange(1, 60))]
+    b = list(a)
+    start = rng.randrange(len(a) + 1)
+    b[start:start + rng.randrange(4)] = [f"new {index}" for index in range(rng.randrange(4))]
+    expected = difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes()
+    assert diff(a, b) == expected
+
+
+@pytest.mark.parametrize("context", [0, 1, 3])
+@pytest.mark.parametrize("seed", range(100))
+def test_group_matches_difflib(seed, context):
+    rng = random.Random(seed)
+    a = [rng.choice("abcdefghij") for _ in range(rng.randrange(1, 80))]
+    b = _mutate(rng, a, "abcdefghij")
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    assert list(group(matcher.get_opcodes(), context)) == list(matcher.get_grouped_opcodes(context))
+
+
+def test_group_of_identical_sequences_is_empty():
+    lines = ["a"] * 30
+    assert list(group(diff(lines, lines))) == []
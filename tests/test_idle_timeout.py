@@ -0,0 +1,80 @@
+import asyncio
+import subprocess
+import time
+
+import pytest
+
+import refery.aio as aio
+from refery.capture import IdleTimeoutExpired, communicate
+from refery.process import popen, terminate
+from refery.supervisor import Supervisor
+
+ENGINES = ["threads", "supervisor", "asyncio"]
+
+
+def _communicate(engine, script, **kwargs):
+    """Run a shell script with the given engine, killing it if it times out."""
+
+    if engine == "asyncio":
+        return asyncio.run(_communicate_async(script, **kwargs))
+
+    process = popen(["sh", "-c", script], start_new_session=True)
+    try:
+        if engine == "supervisor":
+            if not Supervisor.supported():
+                pytest.skip("requires pidfds")
+            supervisor = Supervisor()
+            try:
+                return supervisor.communicate(process, **kwargs)
+            finally:
+                supervisor.close()
+        return communicate(process, **kwargs)
+    except subprocess.TimeoutExpired:
+        terminate(process, 0)
+        raise
+
+
+async def _communicate_async(script, **kwargs):
+    process = await aio.spawn(
+        ["sh", "-c", script],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+    try:
+        return await aio.communicate(process, **kwargs)
+    except subprocess.TimeoutExpired:
+        await aio.terminate(process, 0)
+        raise
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_idle_timeouts_expire_once_outputs_stop(engine):
+    start = time.monotonic()
+    with pytest.raises(IdleTimeoutExpired):
+        _communicate(engine, "echo 0; sleep 0.2; echo 1 >&2; sleep 5",
+                     timeout=5, idle_timeout=0.3)
+    # Counted from the last output
+    assert 0.5 <= time.monotonic() - start < 2
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_outputs_keep_processes_alive(engine):
+    output = _communicate(engine, "for i in 0 1 2 3 4 5 6 7 8 9; do echo $i; sleep 0.1; done",
+                          timeout=5, idle_timeout=0.3)
+    assert output.exit_code == 0
+    assert output.stdout.read().split() == [str(i).encode() for i in range(10)]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_idle_timeouts_do_not_apply_once_outputs_are_closed(engine):
+    output = _communicate(engine, "exec >&- 2>&-; sleep 0.5; exit 4",
+                          timeout=5, idle_timeout=0.2)
+    assert output.exit_code == 4
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_timeouts_still_apply(engine):
+    with pytest.raises(subprocess.TimeoutExpired) as error:
+        _communicate(engine, "while true; do echo; sleep 0.05; done",
+                     timeout=0.3, idle_timeout=0.2)
+    assert not isinstance(error.value, IdleTimeoutExpired)
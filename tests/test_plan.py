@@ -0,0 +1,89 @@
+import pytest
+import yaml
+
+from refery.plan import PlanCache, load_plan
+
+
+def _write(path, *suites, include=None):
+    content = {"testsuites": [{"name": suite, "tests": [{"name": "test"}]} for suite in suites]}
+    if include is not None:
+        content["include"] = include
+    path.write_text(yaml.safe_dump(content))
+
+
+def _load(path, cache):
+    testsuites, cached = load_plan(path, cache)
+    return [testsuite["name"] for testsuite in testsuites], cached
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PlanCache(tmp_path / "cache")
+
+
+def test_unchanged_plans_come_from_the_cache(tmp_path, cache):
+    _write(tmp_path / "main.yaml", "main")
+
+    assert _load(tmp_path / "main.yaml", cache) == (["main"], False)
+    assert _load(tmp_path / "main.yaml", cache) == (["main"], True)
+
+
+def test_plans_are_compiled_again_when_the_test_file_changes(tmp_path, cache):
+    _write(tmp_path / "main.yaml", "main")
+    _load(tmp_path / "main.yaml", cache)
+
+    _write(tmp_path / "main.yaml", "changed")
+
+    assert _load(tmp_path / "main.yaml", cache) == (["changed"], False)
+    assert _load(tmp_path / "main.yaml", cache) == (["changed"], True)
+
+
+def test_unchanged_includes_come_from_the_cache(tmp_path, cache):
+    _write(tmp_path / "main.yaml", "main", include="included.yaml")
+    _write(tmp_path / "included.yaml", "included")
+
+    assert _load(tmp_path / "main.yaml", cache) == (["main", "included"], False)
+    assert _load(tmp_path / "main.yaml", cache) == (["main", "included"], True)
+
+
+def test_plans_are_compiled_again_when_an_include_changes(tmp_path, cache):
+    _write(tmp_path / "main.yaml", "main", include="included.yaml")
+    _write(tmp_path / "included.yaml", "included")
+    _load(tmp_path / "main.yaml", cache)
+
+    _write(tmp_path / "included.yaml", "changed")
+
+    assert _load(tmp_path / "main.yaml", cache) == (["main", "changed"], False)
+    assert _load(tmp_path / "main.yaml", cache) == (["main", "changed"], True)
+
+
+def test_plans_are_compiled_again_when_a_glob_gains_a_file(tmp_path, cache):
+    _write(tmp_path / "main.yaml", "main", include="suites/*.yaml")
+    (tmp_path / "suites").mkdir()
+    _write(tmp_path / "suites" / "a.yaml", "a")
+    _load(tmp_path / "main.yaml", cache)
+
+    _write(tmp_path / "suites" / "b.yaml", "b")
+
+    assert _load(tmp_path / "main.yaml", cache) == (["main", "a", "b"], False)
+
+
+def test_plans_are_compiled_again_when_a_glob_loses_a_file(tmp_path, cache):
+    _write(tmp_path / "main.yaml", "main", include="suites/*.yaml")
+    (tmp_path / "suites").mkdir()
+    _write(tmp_path / "suites" / "a.yaml", "a")
+    _write(tmp_path / "suites" / "b.yaml", "b")
+    _load(tmp_path / "main.yaml", cache)
+
+    (tmp_path / "suites" / "a.yaml").unlink()
+
+    assert _load(tmp_path / "main.yaml", cache) == (["main", "b"], False)
+
+
+def test_errors_in_included_files_name_them(tmp_path, cache):
+    _write(tmp_path / "main.yaml", "main", include="included.yaml")
+    (tmp_path / "included.yaml").write_text("testsuites: [\n")
+
+    with pytest.raises(yaml.MarkedYAMLError) as error:
+        _load(tmp_path / "main.yaml", cache)
+    assert str(tmp_path / "included.yaml") in str(error.value)
@@ -0,0 +1,71 @@
+import os
+import signal
+import subprocess
+import time
+
+import pytest
+
+from refery.process import terminate
+
+pytestmark = pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="requires /proc")
+
+
+def _start(script):
+    """Start a shell script leading its own process group, once it printed a line."""
+
+    process = subprocess.Popen(["sh", "-c", script], stdout=subprocess.PIPE,
+                               start_new_session=True)
+    line = process.stdout.readline()
+    process.stdout.close()
+    return process, line
+
+
+def _running(pid):
+    """Indicate if a process exists and is not a zombie, waiting a bit for it to die."""
+
+    deadline = time.monotonic() + 1
+    while time.monotonic() < deadline:
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as file:
+                stat = file.read()
+        except FileNotFoundError:
+            return False
+        if stat[stat.rindex(b")") + 2:].split()[0] == b"Z":
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_terminate_lets_the_process_exit_on_sigterm():
+    process, _ = _start("echo ready; exec sleep 5")
+    start = time.monotonic()
+    assert terminate(process, grace_period=5) == []
+    assert time.monotonic() - start < 2
+    assert process.returncode == -signal.SIGTERM
+
+
+def test_terminate_escalates_to_sigkill():
+    # Ignored signals stay ignored in the children
+    process, _ = _start("trap '' TERM; echo ready; sleep 5")
+    start = time.monotonic()
+    assert terminate(process, grace_period=0.2) == []
+    assert 0.2 <= time.monotonic() - start < 2
+    assert process.returncode == -signal.SIGKILL
+
+
+def test_terminate_kills_the_process_group():
+    process, line = _start("sleep 5 & echo $!; wait")
+    child = int(line)
+    assert terminate(process, grace_period=0.2) == []
+    assert not _running(child)
+
+
+def test_terminate_reports_the_descendants_left_running():
+    # The child leaves the process group, escaping the signals
+    process, line = _start("setsid sh -c 'echo $$; exec sleep 5' & wait")
+    child = int(line)
+    try:
+        assert terminate(process, grace_period=0.2) == [child]
+        assert _running(child)
+    finally:
+        os.kill(child, signal.SIGKILL)
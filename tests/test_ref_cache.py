@@ -0,0 +1,67 @@
+import os
+
+from refery.capture import BytesOutput, ProcessOutput
+from refery.ref_cache import RefCache
+
+# Each entry takes 11 bytes: 10 of output and a 1-digit exit code
+ENTRY_SIZE = 11
+
+
+def _output(data: bytes) -> ProcessOutput:
+    return ProcessOutput(BytesOutput(data), BytesOutput(b""), 0)
+
+
+def _populate(directory, last_uses):
+    """Store an entry per key, last used at the given times, from a past run."""
+
+    cache = RefCache(directory)
+    for key, last_use in last_uses.items():
+        cache.put(key, _output(key.encode() * 10))
+        os.utime(directory / key, (last_use, last_use))
+
+
+def _keys(directory):
+    return sorted(entry.name for entry in directory.iterdir())
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    _populate(tmp_path, {"a": 1000, "b": 3000, "c": 2000})
+
+    RefCache(tmp_path, max_size=2 * ENTRY_SIZE).put("d", _output(b"d" * 10))
+
+    assert _keys(tmp_path) == ["b", "d"]
+
+
+def test_getting_an_entry_marks_it_as_used(tmp_path):
+    _populate(tmp_path, {"a": 1000, "b": 3000, "c": 2000})
+
+    output = RefCache(tmp_path).get("a")
+    assert output.stdout.read() == b"a" * 10
+    RefCache(tmp_path, max_size=2 * ENTRY_SIZE).put("d", _output(b"d" * 10))
+
+    assert _keys(tmp_path) == ["a", "d"]
+
+
+def test_entries_in_use_are_not_evicted(tmp_path):
+    _populate(tmp_path, {"a": 1000, "b": 3000, "c": 2000})
+
+    cache = RefCache(tmp_path, max_size=2 * ENTRY_SIZE)
+    output = cache.get("a")
+    # Back to the oldest, but the run still reads it
+    os.utime(tmp_path / "a", (0, 0))
+    cache.put("d", _output(b"d" * 10))
+
+    assert _keys(tmp_path) == ["a", "d"]
+    assert output.stdout.read() == b"a" * 10
+
+
+def test_outputs_larger_than_the_cache_are_not_stored(tmp_path):
+    cache = RefCache(tmp_path, max_size=5)
+    cache.put("a", _output(b"a" * 10))
+
+    assert cache.get("a") is None
+    assert _keys(tmp_path) == []
+
+
+def test_missing_entries(tmp_path):
+    assert RefCache(tmp_path).get("a") is None
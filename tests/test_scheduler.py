@@ -0,0 +1,48 @@
+import threading
+
+import pytest
+
+from refery.scheduler import Scheduler
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_abort_skips_the_tasks_submitted_after(jobs):
+    aborted = threading.Event()
+
+    def task(index):
+        if index < 2 and jobs > 1:
+            # Still running when a later task aborts
+            assert aborted.wait(5)
+        if index == 2:
+            scheduler.abort()
+            aborted.set()
+        return index
+
+    with Scheduler(jobs) as scheduler:
+        futures = [scheduler.submit(lambda index=index: task(index)) for index in range(10)]
+        results = [future.result() for future in futures]
+
+    # The tasks before the aborting one complete, as in a serial run
+    assert results == [0, 1, 2] + [None] * 7
+
+
+def test_the_earliest_abort_wins():
+    with Scheduler(1) as scheduler:
+        scheduler.abort(5)
+        scheduler.abort(2)
+        scheduler.abort(4)
+        futures = [scheduler.submit(lambda index=index: index) for index in range(8)]
+        assert [future.result() for future in futures] == [0, 1, 2] + [None] * 5
+
+
+def test_tasks_know_their_index():
+    with Scheduler(2) as scheduler:
+        futures = [scheduler.submit(lambda: scheduler.current) for _ in range(5)]
+        assert [future.result() for future in futures] == list(range(5))
+    assert scheduler.current is None
+
+
+def test_abort_needs_a_task():
+    with Scheduler(1) as scheduler:
+        with pytest.raises(RuntimeError):
+            scheduler.abort()
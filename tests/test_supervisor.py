@@ -0,0 +1,87 @@
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from refery.capture import IdleTimeoutExpired
+from refery.process import popen, terminate
+from refery.supervisor import Supervisor
+
+pytestmark = pytest.mark.skipif(not Supervisor.supported(), reason="requires pidfds")
+
+
+@pytest.fixture
+def supervisor():
+    supervisor = Supervisor()
+    yield supervisor
+    supervisor.close()
+
+
+def _communicate(supervisor, script, **kwargs):
+    """Run a shell script under the supervisor, killing it if it times out."""
+
+    process = popen(["sh", "-c", script], start_new_session=True)
+    try:
+        return supervisor.communicate(process, **kwargs)
+    except subprocess.TimeoutExpired:
+        terminate(process, 0)
+        raise
+
+
+def test_outputs_and_exit_code(supervisor):
+    output = _communicate(supervisor, "cat; echo error >&2; exit 3", stdin=b"input")
+    assert output.stdout.read() == b"input"
+    assert output.stderr.read() == b"error\n"
+    assert output.exit_code == 3
+
+
+def test_deadlines_expire_in_order(supervisor):
+    def run(timeout):
+        try:
+            _communicate(supervisor, "sleep 5", timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return time.monotonic()
+
+    with ThreadPoolExecutor(3) as executor:
+        start = time.monotonic()
+        late = executor.submit(run, 0.6)
+        early = executor.submit(run, 0.2)
+        quick = executor.submit(_communicate, supervisor, "echo done", timeout=5)
+        assert quick.result().stdout.read() == b"done\n"
+        early, late = early.result(), late.result()
+
+    assert start + 0.2 <= early < start + 0.6 <= late < start + 2
+
+
+def test_idle_timeouts_are_pushed_back_by_outputs(supervisor):
+    # Outputs every 0.1s for about 1s, while at most 0.3s of silence are allowed
+    output = _communicate(
+        supervisor, "for i in 0 1 2 3 4 5 6 7 8 9; do echo $i; sleep 0.1; done",
+        timeout=5, idle_timeout=0.3,
+    )
+    assert output.stdout.read().split() == [str(i).encode() for i in range(10)]
+
+
+def test_idle_timeouts_expire_once_outputs_stop(supervisor):
+    start = time.monotonic()
+    with pytest.raises(IdleTimeoutExpired):
+        _communicate(supervisor, "echo 0; sleep 0.2; echo 1; sleep 5",
+                     timeout=5, idle_timeout=0.3)
+    assert 0.5 <= time.monotonic() - start < 2
+
+
+def test_timeouts_expire_even_with_outputs(supervisor):
+    with pytest.raises(subprocess.TimeoutExpired) as error:
+        _communicate(supervisor, "while true; do echo; sleep 0.05; done",
+                     timeout=0.3, idle_timeout=0.2)
+    assert not isinstance(error.value, IdleTimeoutExpired)
+
+
+def test_closed_supervisors_refuse_processes():
+    supervisor = Supervisor()
+    supervisor.close()
+    process = popen(["true"])
+    with pytest.raises(RuntimeError):
+        supervisor.communicate(process)
+    process.communicate()